@@ -0,0 +1,27 @@
+"""
+Gunicorn configuration for the webhook server
+
+Start with: gunicorn -c gunicorn.conf.py webhook_server:app
+"""
+
+import os
+
+# Railway and other cloud services set PORT environment variable
+bind = f"{os.getenv('WEBHOOK_HOST', '0.0.0.0')}:{os.getenv('PORT', os.getenv('WEBHOOK_PORT', '5000'))}"
+
+# Threaded workers: requests only parse, screen and queue events, and the
+# webhook worker threads, HubSpot rate limiter and dedup caches are all
+# thread-based and per process. Keep a single process by default so the
+# HubSpot rate limit is not multiplied by the number of workers
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# Webhook senders reuse connections; requests themselves return in milliseconds
+keepalive = 75
+timeout = 30
+graceful_timeout = 30
+
+# Log requests and errors to stdout/stderr for the platform's log collector
+accesslog = "-"
+errorlog = "-"
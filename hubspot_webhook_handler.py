@@ -8,46 +8,98 @@ Supports:
 - HubSpot Users (Settings API) - internal team members (secondary support)
 """
 
-import requests
+import logging
+import orjson
 import os
-from typing import Dict, Optional
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from utils import (
+    HUBSPOT_ACCESS_TOKEN, HUBSPOT_BASE_URL, HUBSPOT_SESSION, HUBSPOT_TIMEOUT, TokenBucket, capitalize_name,
+    log_error_response, raise_for_transient_status
+)
 
 load_dotenv()
 
-HUBSPOT_ACCESS_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN", None)
-HUBSPOT_BASE_URL = "https://api.hubapi.com"
+logger = logging.getLogger(__name__)
 
-HUBSPOT_HEADERS = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {HUBSPOT_ACCESS_TOKEN}"
-}
+# Candidate keys for first/last names across User, Contact and webhook payload formats
+_FIRST_NAME_KEYS = ("firstName", "firstname", "First Name")
+_LAST_NAME_KEYS = ("lastName", "lastname", "Last Name")
 
+# Lowercased propertyChange property names that hold a first/last name
+_FIRST_NAME_PROPS = frozenset({"firstname", "first name"})
+_LAST_NAME_PROPS = frozenset({"lastname", "last name"})
+_NAME_PROPS = _FIRST_NAME_PROPS | _LAST_NAME_PROPS
+
+# Object types (uppercased) whose webhooks can carry a user/contact
+_USER_OBJECT_TYPES = frozenset({"USER", "USER_DEFINED", "CONTACT"})
+
+# Lowercased expanded-format event types that refer to a user/contact
+_USER_EVENT_TYPES = frozenset({
+    "user.created", "user.updated", "user.propertychange", "user.deleted",
+    "contact.created", "contact.updated", "contact.propertychange"
+})
+_USER_EVENT_PREFIXES = ("object.", "contact.")
+_CONTACT_EVENT_PREFIX = "contact."
+
+# Max inputs per request accepted by HubSpot's CRM batch endpoints
+HUBSPOT_BATCH_SIZE = 100
+
+# Admission control: events accepted per minute for each HubSpot portal.
+# Webhooks beyond this are answered with 429 + Retry-After so HubSpot
+# re-delivers them later instead of piling up work (and HubSpot 429s) here
+HUBSPOT_WEBHOOK_RATE_PER_MINUTE = int(os.getenv("HUBSPOT_WEBHOOK_RATE_PER_MINUTE", "300"))
+# Buckets of idle portals expire; a bucket idle for over a minute is full
+# again anyway, so recreating it later changes nothing
+_ADMISSION_BUCKETS: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+_ADMISSION_LOCK = Lock()
+
+# Names this handler recently wrote or confirmed, per user/contact ID:
+# user_id -> (first_name, last_name). Lets the echo webhook that HubSpot sends
+# after our own update be dropped without any API call
+_NORMALIZED_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+_NORMALIZED_CACHE_LOCK = Lock()
+
+# Recently fetched users/contacts, keyed by (user_id, is_contact), so bursts of
+# events for the same user within a few seconds reuse one GET. Kept for
+# HUBSPOT_USER_CACHE_TTL seconds (default 30)
+HUBSPOT_USER_CACHE_TTL = float(os.getenv("HUBSPOT_USER_CACHE_TTL", "30"))
+_USER_CACHE: TTLCache = TTLCache(maxsize=2048, ttl=HUBSPOT_USER_CACHE_TTL)
+_USER_CACHE_LOCK = Lock()
+
+# Lookups currently in progress, keyed by (user_id, is_contact), so that bursts
+# of events for the same user share one request
+_INFLIGHT_LOOKUPS: Dict[Tuple[str, bool], Future] = {}
+_INFLIGHT_LOCK = Lock()
+
+# Worker threads for issuing independent HubSpot lookups concurrently
+_LOOKUP_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hubspot-lookup")
+
+# Worker threads for processing the User events of one webhook array in
+# parallel (kept apart from _LOOKUP_POOL, which these events wait on)
+_EVENT_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hubspot-event")
+
+
+def pick_name(sources: Tuple[Dict, ...], keys: Tuple[str, ...]) -> str:
+    """Return the first non-empty value for the candidate keys, searching sources in order, or an empty string"""
+    return next((source[key] for source in sources for key in keys if source.get(key)), "")
 
-def capitalize_name(name: str) -> str:
-    """
-    Capitalize the first letter of a name
-    
-    Examples:
-        "john" → "John"
-        "mary jane" → "Mary jane"
-        "O'CONNOR" → "O'connor"
-        "" → ""
-    """
-    if not name or not name.strip():
-        return name
-    
-    # Trim whitespace
-    name = name.strip()
-    
-    # Capitalize first letter, keep rest as-is
-    if len(name) > 0:
-        return name[0].upper() + name[1:] if len(name) > 1 else name[0].upper()
-    
-    return name
+
+def _already_normalized(name: str) -> bool:
+    """Check that capitalize_name would return a name unchanged, without building a new string"""
+    if not name:
+        return True
+    first = name[0]
+    if first.isspace() or name[-1].isspace():
+        return not name.strip()
+    return first == first.upper()
 
 
-def normalize_user_name(first_name: str, last_name: str) -> tuple:
+def normalize_user_name(first_name: str, last_name: str) -> Tuple[str, str]:
     """
     Normalize user names by capitalizing first letters
     
@@ -64,66 +116,134 @@ def normalize_user_name(first_name: str, last_name: str) -> tuple:
     return (normalized_first, normalized_last)
 
 
+def contact_to_user(contact_data: Dict) -> Dict:
+    """Convert a Contacts API record to the user-like format used by the handler"""
+    props = contact_data.get("properties", {})
+    return {
+        "id": contact_data.get("id"),
+        "firstName": props.get("firstname", ""),
+        "lastName": props.get("lastname", ""),
+        "firstname": props.get("firstname", ""),  # Keep lowercase too
+        "lastname": props.get("lastname", ""),      # Keep lowercase too
+        "email": props.get("email", "")
+    }
+
+
 def get_hubspot_user(user_id: str, is_contact: bool = False) -> Optional[Dict]:
     """
     Get a user/contact from HubSpot by ID
     
+    Records are cached for a short while, and concurrent calls for the same
+    user share a single in-flight request: the first caller fetches, the
+    others wait for its result.
+    
     Args:
         user_id: HubSpot user or contact ID
-        is_contact: If True, directly use Contacts API; if False, try Users API first
+        is_contact: If True, directly use Contacts API; if False, query Users and
+            Contacts APIs concurrently (Users API wins if both match)
+    """
+    key = (user_id, is_contact)
+    with _USER_CACHE_LOCK:
+        cached = _USER_CACHE.get(key)
+    if cached is not None:
+        logger.debug("💾 Using cached HubSpot record for %s", user_id)
+        return cached
+    
+    with _INFLIGHT_LOCK:
+        in_flight = _INFLIGHT_LOOKUPS.get(key)
+        if in_flight is None:
+            future: Future = Future()
+            _INFLIGHT_LOOKUPS[key] = future
+    
+    if in_flight is not None:
+        logger.debug("⏳ Waiting for in-flight lookup of %s...", user_id)
+        return in_flight.result()
+    
+    try:
+        user = fetch_hubspot_user(user_id, is_contact)
+        if user:
+            with _USER_CACHE_LOCK:
+                _USER_CACHE[key] = user
+        future.set_result(user)
+        return user
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT_LOOKUPS.pop(key, None)
+
+
+def cache_updated_names(user_id: str, first_name: str, last_name: str, is_contact: bool) -> None:
     """
+    Write a successful name update through to the cached HubSpot records
+    
+    The cached record under the key that was updated gets the new names, so
+    the echo webhook HubSpot sends for our own update needs no GET. Without a
+    cached record one is only created when both names are known.
+    
+    User IDs and Contact IDs are separate namespaces, so the record cached
+    under the other key may be a different object with the same ID; it is
+    only dropped, never given these names.
+    """
+    names: Dict[str, str] = {}
+    if first_name:
+        names.update(firstName=first_name, firstname=first_name)
+    if last_name:
+        names.update(lastName=last_name, lastname=last_name)
+    
+    key = (user_id, is_contact)
+    with _USER_CACHE_LOCK:
+        cached = _USER_CACHE.get(key)
+        if cached is not None:
+            _USER_CACHE[key] = {**cached, **names}
+        elif first_name and last_name:
+            _USER_CACHE[key] = {"id": user_id, **names, "email": ""}
+        _USER_CACHE.pop((user_id, not is_contact), None)
+
+
+def fetch_hubspot_user(user_id: str, is_contact: bool = False) -> Optional[Dict]:
+    """Fetch a user/contact from the HubSpot API (see get_hubspot_user)"""
     if not HUBSPOT_ACCESS_TOKEN:
-        print("  ✗ Error: HUBSPOT_ACCESS_TOKEN not set")
+        logger.error("✗ Error: HUBSPOT_ACCESS_TOKEN not set")
         return None
     
+    contact_url = f"{HUBSPOT_BASE_URL}/crm/v3/objects/contacts/{user_id}"
+    
     # If we know it's a contact, go directly to Contacts API
     if is_contact:
-        print(f"  📞 Fetching Contact {user_id} from Contacts API...")
-        contact_url = f"{HUBSPOT_BASE_URL}/crm/v3/objects/contacts/{user_id}"
-        contact_response = requests.get(contact_url, headers=HUBSPOT_HEADERS)
+        logger.debug("📞 Fetching Contact %s from Contacts API...", user_id)
+        contact_response = HUBSPOT_SESSION.get(contact_url, timeout=HUBSPOT_TIMEOUT)
         if contact_response.status_code == 200:
-            contact_data = contact_response.json()
-            # Convert contact format to user-like format
-            props = contact_data.get("properties", {})
-            return {
-                "id": contact_data.get("id"),
-                "firstName": props.get("firstname", ""),
-                "lastName": props.get("lastname", ""),
-                "firstname": props.get("firstname", ""),  # Keep lowercase too
-                "lastname": props.get("lastname", ""),      # Keep lowercase too
-                "email": props.get("email", "")
-            }
+            return contact_to_user(orjson.loads(contact_response.content))
         else:
-            print(f"  ✗ Error getting Contact: {contact_response.status_code}")
-            print(f"    Response: {contact_response.text}")
+            log_error_response(logger, "Error getting Contact", contact_response)
+            raise_for_transient_status("Error getting Contact", contact_response)
             return None
     
-    # Try Users API first (Settings API)
+    # Unknown object type: fire the Users API (Settings API) and Contacts API
+    # lookups together so a contact costs one round-trip instead of two
     url = f"{HUBSPOT_BASE_URL}/settings/v3/users/{user_id}"
-    response = requests.get(url, headers=HUBSPOT_HEADERS)
+    user_future = _LOOKUP_POOL.submit(HUBSPOT_SESSION.get, url, timeout=HUBSPOT_TIMEOUT)
+    contact_future = _LOOKUP_POOL.submit(HUBSPOT_SESSION.get, contact_url, timeout=HUBSPOT_TIMEOUT)
+    
+    response = user_future.result()
     
     if response.status_code == 200:
-        return response.json()
+        contact_future.cancel()
+        return orjson.loads(response.content)
     elif response.status_code == 404:
-        # If not found as User, might be a Contact - try Contacts API
-        print(f"  ⚠️  User {user_id} not found in Users API, trying Contacts API...")
-        contact_url = f"{HUBSPOT_BASE_URL}/crm/v3/objects/contacts/{user_id}"
-        contact_response = requests.get(contact_url, headers=HUBSPOT_HEADERS)
+        # If not found as User, might be a Contact - use the Contacts API result
+        logger.debug("⚠️  User %s not found in Users API, using Contacts API...", user_id)
+        contact_response = contact_future.result()
         if contact_response.status_code == 200:
-            contact_data = contact_response.json()
-            # Convert contact format to user-like format
-            props = contact_data.get("properties", {})
-            return {
-                "id": contact_data.get("id"),
-                "firstName": props.get("firstname", ""),
-                "lastName": props.get("lastname", ""),
-                "firstname": props.get("firstname", ""),
-                "lastname": props.get("lastname", ""),
-                "email": props.get("email", "")
-            }
+            return contact_to_user(orjson.loads(contact_response.content))
+        raise_for_transient_status("Error getting Contact", contact_response)
+    else:
+        contact_future.cancel()
     
-    print(f"  ✗ Error getting HubSpot user: {response.status_code}")
-    print(f"    Response: {response.text}")
+    log_error_response(logger, "Error getting HubSpot user", response)
+    raise_for_transient_status("Error getting HubSpot user", response)
     return None
 
 
@@ -141,13 +261,13 @@ def update_hubspot_user_name(user_id: str, first_name: str, last_name: str, is_c
         True if successful, False otherwise
     """
     if not HUBSPOT_ACCESS_TOKEN:
-        print("  ✗ Error: HUBSPOT_ACCESS_TOKEN not set")
+        logger.error("✗ Error: HUBSPOT_ACCESS_TOKEN not set")
         return False
     
     # If we know it's a contact, use Contacts API directly
     if is_contact:
         contact_url = f"{HUBSPOT_BASE_URL}/crm/v3/objects/contacts/{user_id}"
-        contact_payload = {
+        contact_payload: Dict[str, Dict[str, str]] = {
             "properties": {}
         }
         if first_name:
@@ -156,34 +276,34 @@ def update_hubspot_user_name(user_id: str, first_name: str, last_name: str, is_c
             contact_payload["properties"]["lastname"] = last_name
         
         if not contact_payload["properties"]:
-            print("  ℹ️  No names to update")
+            logger.debug("ℹ️  No names to update")
             return True
         
-        response = requests.patch(contact_url, headers=HUBSPOT_HEADERS, json=contact_payload)
+        response = HUBSPOT_SESSION.patch(contact_url, data=orjson.dumps(contact_payload), timeout=HUBSPOT_TIMEOUT)
     else:
         # Try Users API first (Settings API)
         url = f"{HUBSPOT_BASE_URL}/settings/v3/users/{user_id}"
         
-        payload = {}
+        payload: Dict[str, str] = {}
         if first_name:
             payload["firstName"] = first_name
         if last_name:
             payload["lastName"] = last_name
         
         if not payload:
-            print("  ℹ️  No names to update")
+            logger.debug("ℹ️  No names to update")
             return True
         
         # Try PATCH first, then PUT if needed
-        response = requests.patch(url, headers=HUBSPOT_HEADERS, json=payload)
+        response = HUBSPOT_SESSION.patch(url, data=orjson.dumps(payload), timeout=HUBSPOT_TIMEOUT)
         
         if response.status_code == 405:
             # Try PUT method
-            response = requests.put(url, headers=HUBSPOT_HEADERS, json=payload)
+            response = HUBSPOT_SESSION.put(url, data=orjson.dumps(payload), timeout=HUBSPOT_TIMEOUT)
         
         if response.status_code == 404:
             # Not a User, try as Contact
-            print(f"  ⚠️  User {user_id} not found, trying as Contact...")
+            logger.debug("⚠️  User %s not found, trying as Contact...", user_id)
             contact_url = f"{HUBSPOT_BASE_URL}/crm/v3/objects/contacts/{user_id}"
             contact_payload = {
                 "properties": {}
@@ -193,20 +313,189 @@ def update_hubspot_user_name(user_id: str, first_name: str, last_name: str, is_c
             if last_name:
                 contact_payload["properties"]["lastname"] = last_name
             
-            response = requests.patch(contact_url, headers=HUBSPOT_HEADERS, json=contact_payload)
+            response = HUBSPOT_SESSION.patch(contact_url, data=orjson.dumps(contact_payload), timeout=HUBSPOT_TIMEOUT)
     
     if response.status_code == 200:
-        print(f"  ✅ Updated name: {first_name} {last_name}")
+        logger.debug("✅ Updated name: %s %s", first_name, last_name)
+        cache_updated_names(user_id, first_name, last_name, is_contact)
         return True
     else:
-        print(f"  ✗ Error updating: {response.status_code}")
-        print(f"    Response: {response.text}")
+        log_error_response(logger, "Error updating", response)
+        raise_for_transient_status("Error updating", response)
         return False
 
 
+def batch_read_hubspot_contacts(contact_ids: List[str]) -> Tuple[Dict[str, Dict], Set[str]]:
+    """
+    Read many contacts with the Contacts batch read endpoint
+    
+    Args:
+        contact_ids: HubSpot contact IDs (duplicates are read once)
+    
+    Returns:
+        Tuple of (contacts, unavailable): contacts maps contact ID to a
+        user-like record (see contact_to_user), contacts that could not be
+        read are missing from it; unavailable holds the IDs whose chunk failed
+        with an exception or 429/5xx and is worth retrying later
+    """
+    if not HUBSPOT_ACCESS_TOKEN:
+        logger.error("✗ Error: HUBSPOT_ACCESS_TOKEN not set")
+        return {}, set()
+    
+    unique_ids = list(dict.fromkeys(contact_ids))
+    chunks = [unique_ids[start:start + HUBSPOT_BATCH_SIZE] for start in range(0, len(unique_ids), HUBSPOT_BATCH_SIZE)]
+    
+    # Chunks are independent, so they are read concurrently
+    contacts: Dict[str, Dict] = {}
+    unavailable: Set[str] = set()
+    futures = [(chunk, _LOOKUP_POOL.submit(_batch_read_contact_chunk, chunk)) for chunk in chunks]
+    for chunk, future in futures:
+        try:
+            contacts.update(future.result())
+        except Exception as e:
+            logger.warning("❌ Batch read of %s Contact(s) failed: %s", len(chunk), e)
+            unavailable.update(chunk)
+    
+    return contacts, unavailable
+
+
+def _batch_read_contact_chunk(chunk: List[str]) -> Dict[str, Dict]:
+    """Read up to HUBSPOT_BATCH_SIZE contacts in one batch read request"""
+    url = f"{HUBSPOT_BASE_URL}/crm/v3/objects/contacts/batch/read"
+    payload = {
+        "inputs": [{"id": contact_id} for contact_id in chunk],
+        "properties": ["firstname", "lastname", "email"]
+    }
+    logger.debug("📞 Batch reading %s Contact(s) from Contacts API...", len(chunk))
+    response = HUBSPOT_SESSION.post(url, data=orjson.dumps(payload), timeout=HUBSPOT_TIMEOUT)
+    
+    # 207 = some inputs failed, the rest are still in "results"
+    if response.status_code not in (200, 207):
+        log_error_response(logger, "Error batch reading Contacts", response)
+        raise_for_transient_status("Error batch reading Contacts", response)
+        return {}
+    
+    return {
+        str(contact_data.get("id")): contact_to_user(contact_data)
+        for contact_data in orjson.loads(response.content).get("results", [])
+    }
+
+
+def batch_update_hubspot_contact_names(updates: Dict[str, Tuple[str, str]]) -> Tuple[Set[str], Set[str]]:
+    """
+    Update many contacts' first and last names with the Contacts batch update endpoint
+    
+    Contacts are sent HUBSPOT_BATCH_SIZE at a time; a batch rejected as
+    invalid (400) falls back to one PATCH per contact.
+    
+    Args:
+        updates: Dict of contact ID to (first_name, last_name); empty names are left unchanged
+    
+    Returns:
+        Tuple of (updated, unavailable): the contact IDs that were updated
+        successfully, and those whose chunk failed with an exception or
+        429/5xx and is worth retrying later
+    """
+    if not HUBSPOT_ACCESS_TOKEN:
+        logger.error("✗ Error: HUBSPOT_ACCESS_TOKEN not set")
+        return set(), set()
+    
+    inputs: List[Dict] = []
+    updated: Set[str] = set()
+    
+    for contact_id, (first_name, last_name) in updates.items():
+        properties = {}
+        if first_name:
+            properties["firstname"] = first_name
+        if last_name:
+            properties["lastname"] = last_name
+        if properties:
+            inputs.append({"id": contact_id, "properties": properties})
+        else:
+            updated.add(contact_id)
+    
+    # Chunks are independent, so they are sent concurrently
+    chunks = [inputs[start:start + HUBSPOT_BATCH_SIZE] for start in range(0, len(inputs), HUBSPOT_BATCH_SIZE)]
+    unavailable: Set[str] = set()
+    futures = [(chunk, _LOOKUP_POOL.submit(_batch_update_contact_chunk, chunk, updates)) for chunk in chunks]
+    for chunk, future in futures:
+        try:
+            updated |= future.result()
+        except Exception as e:
+            logger.warning("❌ Batch update of %s Contact(s) failed: %s", len(chunk), e)
+            unavailable.update(item["id"] for item in chunk)
+    
+    return updated, unavailable
+
+
+def _batch_update_contact_chunk(chunk: List[Dict], updates: Dict[str, Tuple[str, str]]) -> Set[str]:
+    """Send up to HUBSPOT_BATCH_SIZE contact name updates in one batch update request"""
+    url = f"{HUBSPOT_BASE_URL}/crm/v3/objects/contacts/batch/update"
+    response = HUBSPOT_SESSION.post(url, data=orjson.dumps({"inputs": chunk}), timeout=HUBSPOT_TIMEOUT)
+    
+    if response.status_code in (200, 207):
+        chunk_updated = {str(result.get("id")) for result in orjson.loads(response.content).get("results", [])}
+        for contact_id in chunk_updated & updates.keys():
+            cache_updated_names(contact_id, *updates[contact_id], is_contact=True)
+        logger.debug("✅ Batch updated names for %s/%s Contact(s)", len(chunk_updated), len(chunk))
+        return chunk_updated
+    
+    log_error_response(logger, "Error batch updating Contacts", response)
+    
+    # Throttling or a HubSpot outage: single PATCHes would only add load, so the
+    # chunk fails as a whole and is left to the webhook retry
+    raise_for_transient_status("Error batch updating Contacts", response)
+    
+    # One invalid input fails the whole batch, so retry its contacts one by one
+    if response.status_code == 400:
+        logger.debug("🔁 Falling back to single updates for %s Contact(s)...", len(chunk))
+        return {
+            item["id"] for item in chunk
+            if update_hubspot_user_name(item["id"], *updates[item["id"]], is_contact=True)
+        }
+    
+    return set()
+
+
+def remember_normalized_names(user_id: str, first_name: str, last_name: str) -> None:
+    """Record names that are known to be normalized in HubSpot for a user/contact"""
+    with _NORMALIZED_CACHE_LOCK:
+        cached_first, cached_last = _NORMALIZED_CACHE.get(user_id, ("", ""))
+        _NORMALIZED_CACHE[user_id] = (first_name or cached_first, last_name or cached_last)
+
+
+def check_recently_normalized(user_id: str, user_data: Optional[Dict], event: Dict) -> Optional[Dict]:
+    """
+    Short-circuit events that echo names this handler already normalized
+    
+    Returns an "ignored" response dict (without calling HubSpot) when every
+    name in the payload matches what this handler last wrote or confirmed for
+    the user (e.g. HubSpot echoing our own update back). Returns None when the
+    event needs the regular lookup/update flow.
+    """
+    payload_first, payload_last = extract_current_names({}, user_data, event)
+    if not payload_first and not payload_last:
+        return None
+    
+    with _NORMALIZED_CACHE_LOCK:
+        cached = _NORMALIZED_CACHE.get(user_id)
+    if cached is None:
+        return None
+    
+    cached_first, cached_last = cached
+    if (not payload_first or payload_first == cached_first) and (not payload_last or payload_last == cached_last):
+        logger.debug("✅ Names match recently normalized values, no update needed")
+        return {
+            "status": "ignored",
+            "message": "Names already normalized (cache hit)"
+        }
+    
+    return None
+
+
 def validate_expanded_object_payload(event: Dict) -> bool:
     """
-    Validate that the webhook payload matches expanded object support format
+    Check whether the webhook payload matches expanded object support format
     
     Expected format:
     {
@@ -221,28 +510,48 @@ def validate_expanded_object_payload(event: Dict) -> bool:
         "properties": {...} (optional)
     }
     
-    Returns True if payload structure looks valid
+    Returns True if the event has an objectId plus a subscriptionId or occurredAt marker.
+    Other formats are still accepted by the handler; this only identifies the format.
+    """
+    return "objectId" in event and ("subscriptionId" in event or "occurredAt" in event)
+
+
+def admit_hubspot_webhook(event: Union[Dict, List]) -> Optional[Dict]:
+    """
+    Admission check for an incoming HubSpot webhook, before it is queued
+    
+    Each event (every item of an array) takes one token from its portal's bucket.
+    
+    Returns:
+        None if the webhook is admitted, otherwise a "rate_limited" response
+        dict whose retry_after is the number of seconds to wait
     """
-    # Check for expanded object format markers
-    has_subscription_id = "subscriptionId" in event
-    has_object_id = "objectId" in event
-    has_event_type = "eventType" in event
+    first_event = event[0] if isinstance(event, list) and event else event
+    portal_id = str(first_event.get("portalId", "global")) if isinstance(first_event, dict) else "global"
     
-    # At minimum, we need objectId to process
-    if not has_object_id:
-        return False
+    with _ADMISSION_LOCK:
+        bucket = _ADMISSION_BUCKETS.get(portal_id)
+        if bucket is None:
+            bucket = TokenBucket(HUBSPOT_WEBHOOK_RATE_PER_MINUTE / 60, HUBSPOT_WEBHOOK_RATE_PER_MINUTE)
+        # Re-inserting restarts the TTL, so only idle portals expire
+        _ADMISSION_BUCKETS[portal_id] = bucket
     
-    # Expanded format should have subscriptionId and eventType
-    if has_subscription_id and has_event_type:
-        event_type = event.get("eventType", "").lower()
-        # Should start with "object." for expanded format
-        if event_type.startswith("object."):
-            return True
+    # An array larger than the whole bucket is admitted once the bucket is full
+    tokens = min(len(event) if isinstance(event, list) else 1, bucket.capacity)
+    if bucket.consume(tokens):
+        return None
     
-    return True  # Don't reject if format is slightly different, be flexible
+    retry_after = bucket.retry_after(tokens)
+    logger.warning("⏳ HubSpot portal %s over %s events/min, rejecting webhook", portal_id, HUBSPOT_WEBHOOK_RATE_PER_MINUTE)
+    return {
+        "status": "rate_limited",
+        "code": "agent.rate_limited",
+        "message": "Too many HubSpot webhook events, retry later",
+        "retry_after": retry_after
+    }
 
 
-def handle_hubspot_user_webhook(event) -> Dict:
+def handle_hubspot_user_webhook(event: Union[Dict, List]) -> Dict:
     """
     Handle a webhook event from HubSpot
     Normalizes user names (capitalizes first letters)
@@ -255,310 +564,633 @@ def handle_hubspot_user_webhook(event) -> Dict:
         event: Webhook event data from HubSpot
     
     Returns:
-        Response dict with status
+        Response dict with status; when some events failed for a transient
+        reason, "retry_event" holds the payload to process again later
     """
-    print(f"   🔍 Processing HubSpot webhook event...")
+    logger.debug("🔍 Processing HubSpot webhook event...")
     
     # HubSpot can send either a single event (dict) or an array of events
     # Handle array case first
     if isinstance(event, list):
-        print(f"   📦 Received array of {len(event)} event(s), processing each...")
-        results = []
+        logger.debug("📦 Received array of %s event(s), processing as a batch...", len(event))
+        events = []
         for idx, single_event in enumerate(event):
-            print(f"\n   🔄 Processing event {idx + 1}/{len(event)}...")
             if isinstance(single_event, dict):
-                result = handle_single_hubspot_event(single_event)
-                results.append(result)
+                events.append(single_event)
             else:
-                print(f"   ⚠️  Event {idx + 1} is not a dictionary, skipping")
+                logger.warning("⚠️  Event %s is not a dictionary, skipping", idx + 1)
+        
+        results = handle_hubspot_event_batch(events)
         
         # Return summary
-        success_count = sum(1 for r in results if r.get("status") == "success")
-        ignored_count = sum(1 for r in results if r.get("status") == "ignored")
-        error_count = sum(1 for r in results if r.get("status") == "error")
+        status_counts = Counter(r.get("status") for r in results)
+        success_count = status_counts["success"]
+        ignored_count = status_counts["ignored"]
+        error_count = status_counts["error"]
         
-        return {
+        summary = {
             "status": "success" if success_count > 0 else ("ignored" if error_count == 0 else "error"),
             "message": f"Processed {len(event)} event(s): {success_count} succeeded, {ignored_count} ignored, {error_count} errors",
             "results": results
         }
+        
+        # Only the events that failed for a transient reason are tried again
+        retry_events = [
+            hubspot_retry_event(single_event)
+            for single_event, result in zip(events, results) if result.get("retryable")
+        ]
+        if retry_events:
+            summary["retry_event"] = retry_events
+        return summary
     
     # Validate payload structure for single event
     if not isinstance(event, dict):
-        print(f"   ❌ Invalid payload: not a dictionary or array")
+        logger.warning("❌ Invalid payload: not a dictionary or array")
         return {
             "status": "error",
             "message": "Invalid webhook payload format"
         }
     
     # Process single event
-    return handle_single_hubspot_event(event)
+    result = handle_single_hubspot_event(event)
+    if result.get("retryable"):
+        result["retry_event"] = hubspot_retry_event(event)
+    return result
 
 
-def handle_single_hubspot_event(event: Dict) -> Dict:
+def handle_hubspot_event_batch(events: List[Dict]) -> List[Dict]:
+    """
+    Handle several HubSpot webhook events delivered together
     
-    # Log full event structure for debugging
-    print(f"   📄 Event keys: {list(event.keys())}")
-    
-    # Validate expanded object format if applicable
-    is_expanded_format = validate_expanded_object_payload(event)
-    if is_expanded_format and ("subscriptionId" in event or "occurredAt" in event):
-        print(f"   ✅ Detected expanded object support format")
-    
-    # HubSpot webhook structure varies, check common formats
-    # Expanded object support uses standardized format with object.* event types
-    event_type = (
-        event.get("eventType") or 
-        event.get("subscriptionType") or 
-        event.get("type") or
-        event.get("event") or
-        event.get("event_id")
+    Contacts are read and updated with the batch endpoints (up to
+    HUBSPOT_BATCH_SIZE per request) instead of one GET and one PATCH per
+    event; Users go through the single-event path since the Settings API has
+    no batch endpoint, processed in parallel on _EVENT_POOL.
+    
+    Returns:
+        One response dict per event, in input order; failures worth retrying
+        are marked with "retryable"
+    """
+    results: List[Optional[Dict]] = [None] * len(events)
+    contact_events: List[Tuple[int, str, Optional[Dict], Dict]] = []
+    user_futures: List[Tuple[int, str, Future]] = []
+    
+    for idx, single_event in enumerate(events):
+        logger.debug("🔄 Parsing event %s/%s...", idx + 1, len(events))
+        user_id, user_data, is_contact, result = parse_hubspot_event(single_event)
+        if not result:
+            result = check_recently_normalized(user_id, user_data, single_event)
+        if result:
+            results[idx] = result
+        elif is_contact:
+            contact_events.append((idx, user_id, user_data, single_event))
+        else:
+            user_futures.append((idx, user_id, _EVENT_POOL.submit(
+                process_hubspot_user, user_id, user_data, is_contact, single_event
+            )))
+    
+    if contact_events:
+        process_hubspot_contact_batch(contact_events, results)
+    
+    for idx, user_id, future in user_futures:
+        try:
+            results[idx] = future.result()
+        except Exception as e:
+            results[idx] = unavailable_result(user_id, e)
+    
+    return [result for result in results if result is not None]
+
+
+def process_hubspot_contact_batch(contact_events: List[Tuple[int, str, Optional[Dict], Dict]],
+                                  results: List[Optional[Dict]]) -> None:
+    """
+    Normalize the names of several parsed Contact events with batch requests
+    
+    Args:
+        contact_events: (index, contact ID, user_data, event) per Contact event
+        results: Per-event responses, filled in at each event's index
+    """
+    # Name propertyChange events carry their new value; only the rest need a read
+    changed_names = [payload_name_change(user_data, single_event)
+                     for _, _, user_data, single_event in contact_events]
+    lookup_ids = [user_id for (_, user_id, _, _), names in zip(contact_events, changed_names) if not names]
+    contacts, unavailable = batch_read_hubspot_contacts(lookup_ids) if lookup_ids else ({}, set())
+    
+    # Several events for the same contact collapse into one update; a later
+    # event wins per name, so a firstname and a lastname change both apply
+    updates: Dict[str, Tuple[str, str]] = {}
+    pending: List[Tuple[int, str, str, str, str, str]] = []
+    for (idx, user_id, user_data, single_event), names in zip(contact_events, changed_names):
+        if names:
+            current_first, current_last = names
+        else:
+            user = contacts.get(user_id)
+            if not user:
+                if user_id in unavailable:
+                    results[idx] = unavailable_result(user_id, "batch read failed")
+                    continue
+                logger.warning("❌ Could not retrieve contact %s from HubSpot", user_id)
+                results[idx] = {
+                    "status": "error",
+                    "message": f"Could not retrieve user {user_id}"
+                }
+                continue
+            
+            current_first, current_last = extract_current_names(user, user_data, single_event)
+        logger.debug("📝 Current names for %s: '%s' '%s'", user_id, current_first, current_last)
+        skip_result, normalized_first, normalized_last = prepare_name_update(current_first, current_last)
+        if skip_result:
+            remember_normalized_names(user_id, normalized_first, normalized_last)
+            results[idx] = skip_result
+            continue
+        
+        previous_first, previous_last = updates.get(user_id, ("", ""))
+        updates[user_id] = (normalized_first or previous_first, normalized_last or previous_last)
+        pending.append((idx, user_id, current_first, current_last, normalized_first, normalized_last))
+    
+    if updates:
+        logger.debug("🔄 Updating names for %s Contact(s) in HubSpot...", len(updates))
+        updated, unavailable = batch_update_hubspot_contact_names(updates)
+        for user_id in updated:
+            remember_normalized_names(user_id, *updates[user_id])
+        for idx, user_id, current_first, current_last, normalized_first, normalized_last in pending:
+            if user_id in unavailable:
+                results[idx] = unavailable_result(user_id, "batch update failed")
+                continue
+            results[idx] = name_update_result(
+                user_id, user_id in updated,
+                current_first, current_last, normalized_first, normalized_last
+            )
+
+
+def _parse_property_change_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """Format 0: Expanded object format with propertyChange (subscriptionType, objectId, propertyName, propertyValue)"""
+    user_id = str(event.get("objectId"))
+    property_name = (event.get("propertyName") or "").lower()
+    property_value = event.get("propertyValue", "")
+    # Store the property name and value; non-name properties are ignored by the caller
+    user_data = {
+        "propertyName": property_name,
+        "propertyValue": property_value,
+        "objectTypeId": event.get("objectTypeId", ""),  # "0-1" = Contact
+        "subscriptionType": "object.propertychange"
+    }
+    logger.debug("📦 Found expanded object propertyChange: %s (%s=%s)", user_id, property_name, property_value)
+    return (user_id, user_data)
+
+
+def _parse_contact_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """Format 1: Contact-specific webhook format (contact.created, contact.updated, etc.)"""
+    contact_id = event.get("contactId") or event.get("objectId")
+    if not contact_id:
+        return None
+    
+    # Contact properties use lowercase: firstname, lastname
+    user_data = event.get("properties", {})
+    if not user_data:
+        user_data = {}
+        for key in ("firstname", "lastname", "email"):
+            if key in event:
+                user_data[key] = event[key]
+    logger.debug("📦 Found Contact webhook format: %s", contact_id)
+    return (str(contact_id), user_data)
+
+
+def _parse_expanded_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """
+    Format 1: Expanded object support format (generic object model)
+    Expanded format has: subscriptionId, occurredAt, objectId, eventType (object.creation, object.propertyChange, etc.)
+    """
+    if "objectId" not in event:
+        return None
+    
+    # The only parser that needs the event type, so it is lowercased here
+    # rather than passed to every parser
+    event_type = (event.get("eventType") or "").lower()
+    object_type = (event.get("objectType") or "").upper()
+    
+    # Check if it's a user-related object or contact
+    # Support: object.creation, object.propertyChange, object.deletion
+    # Also support contacts: contact.created, contact.propertyChange, etc.
+    is_user_event = (
+        event_type in _USER_EVENT_TYPES or
+        event_type.startswith(_USER_EVENT_PREFIXES) or
+        "USER" in object_type or 
+        "CONTACT" in object_type
     )
-    print(f"   📋 Event type: {event_type}")
+    if not is_user_event:
+        return None
+    
+    # For propertyChange events, properties are in propertyName/propertyValue
+    # For creation/update, properties might be in a separate object
+    user_data = {}
+    
+    # Handle property change events
+    if "propertychange" in event_type:
+        property_name = event.get("propertyName", "")
+        property_value = event.get("propertyValue", "")
+        if property_name:
+            user_data[property_name] = property_value
+    
+    # Also check for properties object
+    if event.get("properties"):
+        user_data.update(event.get("properties", {}))
+    
+    user_id = str(event.get("objectId"))
+    logger.debug("📦 Found expanded object format: %s (type: %s, event: %s)", user_id, object_type, event_type)
+    return (user_id, user_data)
+
+
+def _parse_object_id_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """Format 2: Standard HubSpot subscription webhook (subscriptionId, portalId, eventType, objectId)"""
+    user_id = str(event.get("objectId"))
+    # Properties might be in event or need to fetch from API
+    logger.debug("📦 Found standard objectId format: %s", user_id)
+    return (user_id, event.get("properties", {}))
+
+
+def _parse_user_id_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """Format 3: user.create or user.propertyChange (userId directly)"""
+    user_id = str(event.get("userId"))
+    logger.debug("📦 Found userId format: %s", user_id)
+    return (user_id, event.get("properties", {}))
+
+
+def _parse_user_object_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """Format 4: Full user object in response"""
+    # Check if this looks like a user object
+    if not (event.get("type") == "USER" or "email" in event or "firstName" in event):
+        return None
+    
+    user_id = str(event.get("id"))
+    logger.debug("📦 Found user object format: %s", user_id)
+    return (user_id, event)
+
+
+def _parse_object_type_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """Format 5: HubSpot contact/object webhook with associations"""
+    object_type_val = (event.get("objectType") or "").upper()
+    if object_type_val not in _USER_OBJECT_TYPES:
+        return None
+    
+    user_id = str(event.get("objectId", ""))
+    logger.debug("📦 Found objectType format: %s (type: %s)", user_id, object_type_val)
+    return (user_id, event.get("properties", {}))
+
+
+def _parse_nested_object_format(event: Dict) -> Optional[Tuple[str, Dict]]:
+    """Format 6: Nested object structure (expanded format variant)"""
+    obj = event.get("object", {})
+    if not isinstance(obj, dict):
+        return None
+    
+    obj_id = obj.get("id") or obj.get("objectId")
+    obj_type = obj.get("type") or obj.get("objectType", "")
+    # Support both Users and Contacts
+    if not (obj_id and ("USER" in str(obj_type).upper() or "CONTACT" in str(obj_type).upper() or "firstName" in obj or "firstname" in obj or "email" in obj)):
+        return None
+    
+    logger.debug("📦 Found nested object format: %s (type: %s)", obj_id, obj_type)
+    return (str(obj_id), obj.get("properties", {}) or obj)
+
+
+# Bit per top-level event key that format detection looks at, so an event's
+# keys are scanned once and each predicate is a mask test
+_OBJECT_ID_BIT = 1 << 0
+_CONTACT_ID_BIT = 1 << 1
+_OCCURRED_AT_BIT = 1 << 2
+_SUBSCRIPTION_ID_BIT = 1 << 3
+_USER_ID_BIT = 1 << 4
+_ID_BIT = 1 << 5
+_OBJECT_TYPE_BIT = 1 << 6
+_OBJECT_BIT = 1 << 7
+_EVENT_KEY_BITS = {
+    "objectId": _OBJECT_ID_BIT,
+    "contactId": _CONTACT_ID_BIT,
+    "occurredAt": _OCCURRED_AT_BIT,
+    "subscriptionId": _SUBSCRIPTION_ID_BIT,
+    "userId": _USER_ID_BIT,
+    "id": _ID_BIT,
+    "objectType": _OBJECT_TYPE_BIT,
+    "object": _OBJECT_BIT,
+}
+
+
+def event_key_mask(event: Dict) -> int:
+    """Bitmask of the _EVENT_KEY_BITS keys present in an event"""
+    mask = 0
+    for key in _EVENT_KEY_BITS.keys() & event.keys():
+        mask |= _EVENT_KEY_BITS[key]
+    return mask
+
+
+# Webhook format detection table: (predicate, parser) pairs tried in priority order.
+# Predicates receive the event's key mask plus its lowercased eventType and
+# subscriptionType, parsers just the event; a parser returns
+# (user_id, user_data) or None to fall through to the next format
+_EVENT_FORMAT_HANDLERS: Tuple[Tuple[Callable[[int, str, str], bool], Callable[[Dict], Optional[Tuple[str, Dict]]]], ...] = (
+    (lambda m, et, st: st == "object.propertychange" and bool(m & _OBJECT_ID_BIT),
+     _parse_property_change_format),
+    (lambda m, et, st: et.startswith(_CONTACT_EVENT_PREFIX) or bool(m & _CONTACT_ID_BIT), _parse_contact_format),
+    (lambda m, et, st: bool(m & (_OCCURRED_AT_BIT | _SUBSCRIPTION_ID_BIT)), _parse_expanded_format),
+    (lambda m, et, st: bool(m & _OBJECT_ID_BIT), _parse_object_id_format),
+    (lambda m, et, st: bool(m & _USER_ID_BIT), _parse_user_id_format),
+    (lambda m, et, st: bool(m & _ID_BIT), _parse_user_object_format),
+    (lambda m, et, st: bool(m & _OBJECT_TYPE_BIT), _parse_object_type_format),
+    (lambda m, et, st: bool(m & _OBJECT_BIT), _parse_nested_object_format),
+)
+
+
+def parse_hubspot_event(event: Dict) -> Tuple[str, Optional[Dict], bool, Optional[Dict]]:
+    """
+    Work out which user/contact a HubSpot webhook event refers to
+    
+    Returns:
+        Tuple of (user_id, user_data, is_contact, result); result is a
+        response dict (and user_id is "") when the event should not be processed any further
+    """
+    # Discriminator values used throughout format detection, normalized once
+    lowered_event_type = (event.get("eventType") or "").lower()
+    lowered_subscription_type = (event.get("subscriptionType") or "").lower()
+    upper_object_type = str(event.get("objectType") or "").upper()
+    
+    # Events for other CRM objects (companies, deals, ...) never carry a user name
+    if upper_object_type and upper_object_type not in _USER_OBJECT_TYPES:
+        logger.debug("⏭️  Object type '%s' is not a user/contact, ignoring", upper_object_type)
+        return ("", None, False, {
+            "status": "ignored",
+            "message": f"Object type '{upper_object_type}' does not require name normalization"
+        })
+    
+    # Log full event structure for debugging
+    logger.debug("📄 Event keys: %s", event.keys())
+    
+    # Report expanded object format and the raw event type (only used for debug logging)
+    if logger.isEnabledFor(logging.DEBUG):
+        if validate_expanded_object_payload(event):
+            logger.debug("✅ Detected expanded object support format")
+        
+        # HubSpot webhook structure varies, check common formats
+        # Expanded object support uses standardized format with object.* event types
+        event_type = (
+            event.get("eventType") or 
+            event.get("subscriptionType") or 
+            event.get("type") or
+            event.get("event") or
+            event.get("event_id")
+        )
+        logger.debug("📋 Event type: %s", event_type)
     
     # Extract user information from different webhook formats
     # PRIORITY: Check expanded object support format FIRST (most common with enabled feature)
+    # First format whose predicate matches and whose parser finds an ID wins
     user_id = None
     user_data = None
     
-    # Format 0: Expanded object format with propertyChange - CHECK THIS FIRST
-    # HubSpot expanded object format sends: subscriptionType, objectId, propertyName, propertyValue
-    subscription_type = event.get("subscriptionType", "").lower()
-    if subscription_type == "object.propertychange" and "objectId" in event:
-        object_id = str(event.get("objectId"))
-        property_name = event.get("propertyName", "").lower()
-        
-        # Only process firstname/lastname property changes
-        if property_name in ["firstname", "lastname", "first name", "last name"]:
-            user_id = object_id
-            property_value = event.get("propertyValue", "")
-            # Store the property name and value
-            user_data = {
-                "propertyName": property_name,
-                "propertyValue": property_value,
-                "objectTypeId": event.get("objectTypeId", ""),  # "0-1" = Contact
-                "subscriptionType": subscription_type
-            }
-            print(f"   📦 Found expanded object propertyChange: {user_id} ({property_name}={property_value})")
-    
-    # Format 1: Contact-specific webhook format (contact.created, contact.updated, etc.)
-    elif event.get("eventType", "").lower().startswith("contact.") or "contactId" in event:
-        contact_id = event.get("contactId") or event.get("objectId")
-        if contact_id:
-            user_id = str(contact_id)
-            # Contact properties use lowercase: firstname, lastname
-            user_data = event.get("properties", {})
-            if not user_data:
-                user_data = {}
-                for key in ["firstname", "lastname", "email"]:
-                    if key in event:
-                        user_data[key] = event[key]
-            print(f"   📦 Found Contact webhook format: {user_id}")
-    
-    # Format 1: Expanded object support format (generic object model)
-    # Expanded format has: subscriptionId, occurredAt, objectId, eventType (object.creation, object.propertyChange, etc.)
-    elif "occurredAt" in event or "subscriptionId" in event:
-        # Expanded object format structure
-        if "objectId" in event:
-            object_id = str(event.get("objectId"))
-            object_type = event.get("objectType", "").upper()
-            expanded_event_type = event.get("eventType", "").lower()
-            
-            # Check if it's a user-related object or contact
-            # Support: object.creation, object.propertyChange, object.deletion
-            # Also support contacts: contact.created, contact.propertyChange, etc.
-            is_user_event = (
-                "USER" in object_type or 
-                "CONTACT" in object_type or
-                expanded_event_type.startswith("object.") or
-                expanded_event_type.startswith("contact.") or
-                expanded_event_type in ["user.created", "user.updated", "user.propertychange", "user.deleted",
-                                       "contact.created", "contact.updated", "contact.propertychange"]
-            )
-            
-            if is_user_event:
-                user_id = object_id
-                # For propertyChange events, properties are in propertyName/propertyValue
-                # For creation/update, properties might be in a separate object
-                user_data = {}
-                
-                # Handle property change events
-                if "propertyChange" in expanded_event_type or "propertychange" in expanded_event_type:
-                    property_name = event.get("propertyName", "")
-                    property_value = event.get("propertyValue", "")
-                    if property_name:
-                        user_data[property_name] = property_value
-                
-                # Also check for properties object
-                if event.get("properties"):
-                    user_data.update(event.get("properties", {}))
-                
-                print(f"   📦 Found expanded object format: {user_id} (type: {object_type}, event: {expanded_event_type})")
-    
-    # Format 2: Standard HubSpot subscription webhook (subscriptionId, portalId, eventType, objectId)
-    if not user_id and "objectId" in event:
-        user_id = str(event.get("objectId"))
-        # Properties might be in event or need to fetch from API
-        user_data = event.get("properties", {})
-        print(f"   📦 Found standard objectId format: {user_id}")
-    
-    # Format 3: user.create or user.propertyChange (userId directly)
-    elif not user_id and "userId" in event:
-        user_id = str(event.get("userId"))
-        user_data = event.get("properties", {})
-        print(f"   📦 Found userId format: {user_id}")
-    
-    # Format 4: Full user object in response
-    elif not user_id and "id" in event:
-        # Check if this looks like a user object
-        if event.get("type") == "USER" or "email" in event or "firstName" in event:
-            user_id = str(event.get("id"))
-            user_data = event
-            print(f"   📦 Found user object format: {user_id}")
-    
-    # Format 5: HubSpot contact/object webhook with associations
-    elif not user_id and "objectType" in event:
-        object_type_val = event.get("objectType", "").upper()
-        if object_type_val in ["USER", "USER_DEFINED", "CONTACT"]:
-            user_id = str(event.get("objectId", ""))
-            user_data = event.get("properties", {})
-            print(f"   📦 Found objectType format: {user_id} (type: {object_type_val})")
-    
-    # Format 6: Nested object structure (expanded format variant)
-    if not user_id and "object" in event:
-        obj = event.get("object", {})
-        if isinstance(obj, dict):
-            obj_id = obj.get("id") or obj.get("objectId")
-            obj_type = obj.get("type") or obj.get("objectType", "")
-            # Support both Users and Contacts
-            if obj_id and ("USER" in str(obj_type).upper() or "CONTACT" in str(obj_type).upper() or "firstName" in obj or "firstname" in obj or "email" in obj):
-                user_id = str(obj_id)
-                user_data = obj.get("properties", {}) or obj
-                print(f"   📦 Found nested object format: {user_id} (type: {obj_type})")
-    
+    key_mask = event_key_mask(event)
+    for matches_format, parse_format in _EVENT_FORMAT_HANDLERS:
+        if matches_format(key_mask, lowered_event_type, lowered_subscription_type):
+            parsed = parse_format(event)
+            if parsed and parsed[0]:
+                user_id, user_data = parsed
+                break
     
     # If we found a propertyChange event, check if we should process it
     # Only process firstname/lastname changes - other properties are ignored
+    property_name = ((user_data or {}).get("propertyName") or event.get("propertyName") or "").lower()
     if user_id and user_data and user_data.get("subscriptionType") == "object.propertychange":
-        property_name = user_data.get("propertyName", "").lower()
-        if property_name not in ["firstname", "lastname", "first name", "last name"]:
-            print(f"   ⏭️  Property '{property_name}' is not firstname/lastname, ignoring")
-            return {
+        if property_name not in _NAME_PROPS:
+            logger.debug("⏭️  Property '%s' is not firstname/lastname, ignoring", property_name)
+            return ("", None, False, {
                 "status": "ignored",
                 "message": f"Property '{property_name}' does not require name normalization"
-            }
+            })
     
     if not user_id:
-        print(f"   ⏭️  No user ID found in webhook event (may not be a name-related event)")
-        print(f"   📄 Event keys: {list(event.keys())}")
-        return {
+        logger.debug("⏭️  No user ID found in webhook event (may not be a name-related event)")
+        logger.debug("📄 Event keys: %s", event.keys())
+        return ("", None, False, {
             "status": "ignored",
             "message": "No user ID found in webhook event"
-        }
+        })
+    
+    logger.debug("🆔 Contact/User ID: %s", user_id)
     
-    print(f"   🆔 Contact/User ID: {user_id}")
+    # A name propertyChange that is already capitalized (including the echo of
+    # our own update) needs no lookup and no update
+    changed_names = payload_name_change(user_data, event)
+    if changed_names and _already_normalized(changed_names[0]) and _already_normalized(changed_names[1]):
+        remember_normalized_names(user_id, *changed_names)
+        logger.debug("✅ '%s' already normalized in payload, no update needed", property_name)
+        return ("", None, False, {
+            "status": "ignored",
+            "message": "Names already normalized (payload short-circuit)"
+        })
+    
+    # Same for payloads that carry both names (creation events, User objects)
+    payload_names = payload_full_name(user_data, event)
+    if payload_names and _already_normalized(payload_names[0]) and _already_normalized(payload_names[1]):
+        remember_normalized_names(user_id, *payload_names)
+        logger.debug("✅ Names already normalized in payload, no update needed")
+        return ("", None, False, {
+            "status": "ignored",
+            "message": "Names already normalized (payload short-circuit)"
+        })
     
     # Check objectTypeId to determine if it's a Contact
     # "0-1" = Contact, need to use Contacts API
     object_type_id = user_data.get("objectTypeId", "") if user_data else event.get("objectTypeId", "")
+    # Legacy contact subscriptions ("contact.propertyChange" etc.) are always Contacts too
     is_contact = (object_type_id == "0-1" or 
                   event.get("objectTypeId", "") == "0-1" or
-                  "contact" in str(event.get("objectType", "")).lower())
+                  "CONTACT" in upper_object_type or
+                  lowered_subscription_type.startswith(_CONTACT_EVENT_PREFIX) or
+                  lowered_event_type.startswith(_CONTACT_EVENT_PREFIX))
     
-    # Get current user/contact data from HubSpot API (more reliable than webhook payload)
-    user = get_hubspot_user(user_id, is_contact=is_contact)
-    if not user:
-        print(f"   ❌ Could not retrieve user from HubSpot")
-        return {
-            "status": "error",
-            "message": f"Could not retrieve user {user_id}"
-        }
+    return (user_id, user_data, is_contact, None)
+
+
+def handle_single_hubspot_event(event: Dict) -> Dict:
+    """Handle a single HubSpot webhook event (see handle_hubspot_user_webhook)"""
+    user_id, user_data, is_contact, result = parse_hubspot_event(event)
+    if result:
+        return result
+    
+    try:
+        return process_hubspot_user(user_id, user_data, is_contact, event)
+    except Exception as e:
+        return unavailable_result(user_id, e)
+
+
+def unavailable_result(user_id: str, error: object) -> Dict:
+    """
+    Response dict for an event that failed for a reason worth retrying later
+    (an exception such as a network error, or HubSpot answering 429/5xx)
+    """
+    logger.warning("❌ Could not process user %s, will retry: %s", user_id, error)
+    return {
+        "status": "error",
+        "message": f"Could not process user {user_id}: {error}",
+        "user_id": user_id,
+        "retryable": True
+    }
+
+
+def hubspot_retry_event(event: Dict) -> Dict:
+    """
+    Copy of an event to process again on a retry
+    
+    The propertyChange value is dropped: the name may have been edited again by
+    the time the retry runs, so the retry re-reads the record instead of
+    writing back the old value.
+    """
+    return {key: value for key, value in event.items() if key != "propertyValue"}
+
+
+def process_hubspot_user(user_id: str, user_data: Optional[Dict], is_contact: bool, event: Dict) -> Dict:
+    """Fetch a parsed event's user/contact from HubSpot and normalize its names"""
+    cached_result = check_recently_normalized(user_id, user_data, event)
+    if cached_result:
+        return cached_result
+    
+    changed_names = payload_name_change(user_data, event)
+    if changed_names:
+        # propertyChange payload already has the new value, no GET needed
+        current_first, current_last = changed_names
+    else:
+        # Get current user/contact data from HubSpot API (more reliable than webhook payload)
+        user = get_hubspot_user(user_id, is_contact=is_contact)
+        if not user:
+            logger.warning("❌ Could not retrieve user from HubSpot")
+            return {
+                "status": "error",
+                "message": f"Could not retrieve user {user_id}"
+            }
+        
+        current_first, current_last = extract_current_names(user, user_data, event)
+    logger.debug("📝 Current names: '%s' '%s'", current_first, current_last)
+    skip_result, normalized_first, normalized_last = prepare_name_update(current_first, current_last)
+    if skip_result:
+        remember_normalized_names(user_id, normalized_first, normalized_last)
+        return skip_result
+    
+    # Update user/contact in HubSpot
+    logger.debug("🔄 Updating names in HubSpot...")
+    success = update_hubspot_user_name(user_id, normalized_first, normalized_last, is_contact=is_contact)
+    if success:
+        remember_normalized_names(user_id, normalized_first, normalized_last)
+    
+    return name_update_result(user_id, success, current_first, current_last, normalized_first, normalized_last)
+
+
+def payload_name_change(user_data: Optional[Dict], event: Dict) -> Optional[Tuple[str, str]]:
+    """
+    Read the changed name straight from a firstname/lastname propertyChange
+    
+    The payload already carries the new value, so these events need no GET;
+    only the changed name is set and the other one is left empty so that the
+    update touches just that property.
     
-    # Extract current names from API response (most reliable)
+    Returns:
+        Tuple of (first_name, last_name), or None for any other event
+    """
+    property_name = ((user_data or {}).get("propertyName") or event.get("propertyName") or "").lower()
+    property_value = (user_data or {}).get("propertyValue") or event.get("propertyValue") or ""
+    if not property_value:
+        return None
+    if property_name in _FIRST_NAME_PROPS:
+        return (str(property_value), "")
+    if property_name in _LAST_NAME_PROPS:
+        return ("", str(property_value))
+    return None
+
+
+def payload_full_name(user_data: Optional[Dict], event: Dict) -> Optional[Tuple[str, str]]:
+    """
+    Read both names from the webhook payload itself
+    
+    Returns:
+        Tuple of (first_name, last_name) if the payload has both as
+        non-empty strings, otherwise None
+    """
+    event_props = event.get("properties", {})
+    sources = (user_data or {}, event_props if isinstance(event_props, dict) else {})
+    first_name = pick_name(sources, _FIRST_NAME_KEYS)
+    last_name = pick_name(sources, _LAST_NAME_KEYS)
+    if first_name and last_name and isinstance(first_name, str) and isinstance(last_name, str):
+        return (first_name, last_name)
+    return None
+
+
+def extract_current_names(user: Dict, user_data: Optional[Dict], event: Dict) -> Tuple[str, str]:
+    """
+    Work out the current first and last name of a user/contact
+    
+    The HubSpot API record wins, then the webhook payload fills in the gaps;
+    a propertyChange value always replaces the name it changed.
+    
+    Returns:
+        Tuple of (first_name, last_name)
+    """
+    # Names are looked up in priority order: API response (most reliable),
+    # then webhook payload, then the event's Contact properties.
     # Handle both User format (firstName/lastName) and Contact format (firstname/lastname)
-    current_first = user.get("firstName", "") or user.get("firstname", "") or ""
-    current_last = user.get("lastName", "") or user.get("lastname", "") or ""
+    event_props = event.get("properties", {})
+    sources = (user, user_data or {}, event_props if isinstance(event_props, dict) else {})
+    current_first = pick_name(sources, _FIRST_NAME_KEYS)
+    current_last = pick_name(sources, _LAST_NAME_KEYS)
     
-    # If names are empty, try from webhook payload
-    # Handle both standard format and expanded object format (propertyName/propertyValue)
+    # Expanded format: propertyName might be "firstName" or "firstname" and propertyValue contains the value
+    # The changed property always wins over the stored value
     if user_data:
-        # Standard property format (check both camelCase and lowercase)
-        if not current_first:
-            current_first = (
-                user_data.get("firstName", "") or 
-                user_data.get("firstname", "") or
-                user_data.get("First Name", "") or
-                ""
-            )
-        if not current_last:
-            current_last = (
-                user_data.get("lastName", "") or 
-                user_data.get("lastname", "") or
-                user_data.get("Last Name", "") or
-                ""
-            )
-        
-        # Expanded format: propertyName might be "firstName" or "firstname" and propertyValue contains the value
-        # Also check if propertyName indicates which field changed
         property_name = (user_data.get("propertyName", "") or "").lower()
         property_value = user_data.get("propertyValue", "")
         
-        if property_name in ["firstname", "first name"] and property_value:
+        if property_name in _FIRST_NAME_PROPS and property_value:
             current_first = str(property_value)
-        elif property_name in ["lastname", "last name"] and property_value:
+        elif property_name in _LAST_NAME_PROPS and property_value:
             current_last = str(property_value)
     
-    # Also check event directly for Contact-specific fields
-    if not current_first or not current_last:
-        # Check event payload directly for Contact properties
-        event_props = event.get("properties", {})
-        if isinstance(event_props, dict):
-            if not current_first:
-                current_first = (
-                    event_props.get("firstname", "") or 
-                    event_props.get("firstName", "") or
-                    event_props.get("First Name", "") or
-                    ""
-                )
-            if not current_last:
-                current_last = (
-                    event_props.get("lastname", "") or 
-                    event_props.get("lastName", "") or
-                    event_props.get("Last Name", "") or
-                    ""
-                )
-    
-    print(f"   📝 Current names: '{current_first}' '{current_last}'")
+    return (current_first, current_last)
+
+
+def prepare_name_update(current_first: str, current_last: str) -> Tuple[Optional[Dict], str, str]:
+    """
+    Normalize the current names and decide whether HubSpot needs an update
     
+    Returns:
+        Tuple of (skip_result, normalized_first, normalized_last); skip_result
+        is an "ignored" response dict when no update is needed
+    """
     # Skip if no names to normalize
     if not current_first and not current_last:
-        print(f"   ⏭️  No names found, skipping normalization")
-        return {
+        logger.debug("⏭️  No names found, skipping normalization")
+        return ({
             "status": "ignored",
             "message": "User has no first or last name to normalize"
-        }
+        }, "", "")
     
-    # Normalize names
-    normalized_first, normalized_last = normalize_user_name(current_first, current_last)
-    
-    print(f"   ✨ Normalized names: '{normalized_first}' '{normalized_last}'")
-    
-    # Check if update is needed
-    needs_update = (current_first != normalized_first) or (current_last != normalized_last)
-    
-    if not needs_update:
-        print(f"   ✅ Names already normalized, no update needed")
-        return {
+    # Check if update is needed before building any normalized strings
+    if _already_normalized(current_first) and _already_normalized(current_last):
+        logger.debug("✅ Names already normalized, no update needed")
+        return ({
             "status": "ignored",
             "message": "Names already normalized"
-        }
+        }, current_first, current_last)
     
-    # Update user/contact in HubSpot
-    print(f"   🔄 Updating names in HubSpot...")
-    success = update_hubspot_user_name(user_id, normalized_first, normalized_last, is_contact=is_contact)
+    # Normalize names
+    normalized_first, normalized_last = normalize_user_name(current_first, current_last)
+    
+    logger.debug("✨ Normalized names: '%s' '%s'", normalized_first, normalized_last)
     
+    return (None, normalized_first, normalized_last)
+
+
+def name_update_result(user_id: str, success: bool, current_first: str, current_last: str,
+                       normalized_first: str, normalized_last: str) -> Dict:
+    """Build the response dict for a name update attempt"""
     if success:
-        print(f"   ✅ Successfully normalized user name")
+        logger.info("✅ Successfully normalized user name: %s", user_id)
         return {
             "status": "success",
             "message": f"User {user_id} name normalized",
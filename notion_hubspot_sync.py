@@ -3,11 +3,23 @@ Notion to HubSpot User Sync
 Syncs users created/updated in Notion to HubSpot automatically
 """
 
+import hashlib
+import logging
 import requests
-import json
+import orjson
 import os
-from typing import Dict, Optional
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock, Thread
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Set, Tuple
 from datetime import datetime
+from cachetools import TTLCache
+from urllib3.util.retry import Retry
+from utils import (
+    HUBSPOT_ACCESS_TOKEN, HUBSPOT_BASE_URL, HUBSPOT_SESSION, HUBSPOT_TIMEOUT, NOTION_RATE_LIMITER,
+    RateLimitedAdapter, RateLimitedRetry, capitalize_name, log_error_response, raise_for_transient_status
+)
 
 # Try to load from .env file if python-dotenv is available
 try:
@@ -16,14 +28,13 @@ try:
 except ImportError:
     pass
 
+logger = logging.getLogger(__name__)
+
 # Configuration
 NOTION_TOKEN = os.getenv("NOTION_TOKEN", os.getenv("NOTION_API_KEY", None))
 NOTION_VERSION = "2022-06-28"
 NOTION_BASE_URL = "https://api.notion.com/v1"
 
-HUBSPOT_ACCESS_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN", None)
-HUBSPOT_BASE_URL = "https://api.hubapi.com"
-
 # Headers
 NOTION_HEADERS = {
     "Authorization": f"Bearer {NOTION_TOKEN}",
@@ -31,46 +42,118 @@ NOTION_HEADERS = {
     "Notion-Version": NOTION_VERSION
 }
 
-HUBSPOT_HEADERS = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {HUBSPOT_ACCESS_TOKEN}"
-}
+# Seconds to wait for Notion before giving up on a request, so a stalled
+# API call cannot hold a webhook worker thread indefinitely
+NOTION_TIMEOUT = 10.0
+
+
+def _build_retry() -> RateLimitedRetry:
+    """Retry policy for transient Notion errors (429 waits out Retry-After)"""
+    # The database query is a POST and status writes are PATCHes, both safe to
+    # resend, so they are retried along with the idempotent methods
+    return RateLimitedRetry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"PATCH", "POST"},
+        raise_on_status=False
+    )
+
+
+# Shared session so calls to api.notion.com reuse pooled keep-alive
+# connections instead of a TCP+TLS handshake per request (HUBSPOT_SESSION
+# in utils does the same for HubSpot). Auth headers are set once here
+NOTION_SESSION = requests.Session()
+NOTION_SESSION.headers.update(NOTION_HEADERS)
+# Notion calls wait on their own rate limiter
+NOTION_SESSION.mount("https://", RateLimitedAdapter(
+    NOTION_RATE_LIMITER, pool_connections=20, pool_maxsize=50, max_retries=_build_retry()
+))
+
+# Users synced in parallel by sync_all_users_from_notion (their Notion calls
+# are still held to NOTION_RATE_LIMIT by the session)
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "9"))
+
+# Notion sync status updates are written by a background worker so syncs
+# don't wait on a second Notion round-trip
+_STATUS_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="notion-status")
+
+# Page syncs currently in progress, keyed by page ID, and pages that got
+# another event while their sync was running
+_INFLIGHT_SYNCS: Dict[str, Future] = {}
+_PENDING_RESYNCS: Set[str] = set()
+_INFLIGHT_SYNC_LOCK = Lock()
+
+# Pages buffered between the database query and the sync workers
+SYNC_QUEUE_SIZE = int(os.getenv("SYNC_QUEUE_SIZE", "200"))
+
+# HubSpot user IDs by email, so repeated syncs (and 409 "already exists"
+# retries) for the same user skip the lookup request. Kept for
+# HUBSPOT_EMAIL_CACHE_TTL seconds (default 60); the webhook handler's user
+# record cache has its own HUBSPOT_USER_CACHE_TTL
+HUBSPOT_EMAIL_CACHE_TTL = float(os.getenv("HUBSPOT_EMAIL_CACHE_TTL", "60"))
+_EMAIL_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=HUBSPOT_EMAIL_CACHE_TTL)
+_EMAIL_CACHE_LOCK = Lock()
+
+
+def remember_hubspot_user_id(email: str, hubspot_user_id: str) -> None:
+    """Cache the HubSpot user ID for an email"""
+    with _EMAIL_CACHE_LOCK:
+        _EMAIL_CACHE[email.lower()] = hubspot_user_id
+
+
+def hubspot_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request to the HubSpot API through the shared, rate-limited session
+    
+    429s are retried by the session's urllib3 Retry, which waits out Retry-After.
+    """
+    return HUBSPOT_SESSION.request(method, url, timeout=HUBSPOT_TIMEOUT, **kwargs)
 
 
 def get_notion_user(user_page_id: str) -> Optional[Dict]:
     """Get a user page from Notion by page ID"""
     url = f"{NOTION_BASE_URL}/pages/{user_page_id}"
-    response = requests.get(url, headers=NOTION_HEADERS)
+    response = NOTION_SESSION.get(url, timeout=NOTION_TIMEOUT)
     
     if response.status_code == 200:
-        return response.json()
+        return orjson.loads(response.content)
     else:
-        print(f"✗ Error getting Notion user: {response.status_code}")
-        print(f"  Response: {response.text}")
+        log_error_response(logger, "Error getting Notion user", response)
+        raise_for_transient_status("Error getting Notion user", response)
         return None
 
 
-def capitalize_name(name: str) -> str:
-    """
-    Capitalize the first letter of a name
-    
-    Examples:
-        "john" → "John"
-        "mary jane" → "Mary jane"
-        "O'CONNOR" → "O'connor"
-        "" → ""
-    """
-    if not name or not name.strip():
-        return name
-    
-    # Trim whitespace
-    name = name.strip()
-    
-    # Capitalize first letter, keep rest as-is
-    if len(name) > 0:
-        return name[0].upper() + name[1:] if len(name) > 1 else name[0].upper()
-    
-    return name
+def _rich_text_content(prop: Dict) -> str:
+    """Plain text of the first rich_text block of a Notion property"""
+    rich_text = prop.get("rich_text")
+    return rich_text[0].get("text", {}).get("content", "") if rich_text else ""
+
+
+def _rollup_select_name(prop: Dict) -> str:
+    """Name of the first select value in a Notion rollup property"""
+    rollup_values = (prop.get("rollup") or {}).get("rollup_property")
+    return rollup_values[0].get("select", {}).get("name", "") if rollup_values else ""
+
+
+# Notion property → user field table used by extract_user_properties:
+# (field, Notion property name, extractor taking the property dict)
+_PROPERTY_SPEC: Tuple[Tuple[str, str, Callable[[Dict], Any]], ...] = (
+    # Mandatory fields
+    ("email", "✅ Email", lambda prop: prop.get("email") or ""),
+    ("first_name", "✅ First Name", _rich_text_content),
+    ("last_name", "✅ Last Name", _rich_text_content),
+    # HubSpot Role from rollup
+    ("hubspot_role", "✅ HubSpot Role", _rollup_select_name),
+    # Optional fields
+    ("phone", "📝 Phone Number", lambda prop: prop.get("phone_number") or ""),
+    # HubSpot tracking fields
+    ("hubspot_created", "📝 HubSpot Created", lambda prop: prop.get("checkbox") or False),
+    ("hubspot_user_id", "📝 HubSpot User ID", _rich_text_content),
+)
+
+# Shared read-only stand-in for properties missing from a page
+_MISSING_PROPERTY: Mapping[str, Any] = MappingProxyType({})
 
 
 def extract_user_properties(notion_user: Dict) -> Dict:
@@ -80,65 +163,30 @@ def extract_user_properties(notion_user: Dict) -> Dict:
     """
     properties = notion_user.get("properties", {})
     
-    # Extract mandatory fields
-    email = ""
-    first_name = ""
-    last_name = ""
-    
-    # Email
-    email_prop = properties.get("✅ Email", {})
-    if email_prop.get("email"):
-        email = email_prop["email"]
-    
-    # First Name
-    first_name_prop = properties.get("✅ First Name", {})
-    if first_name_prop.get("rich_text") and len(first_name_prop["rich_text"]) > 0:
-        first_name = first_name_prop["rich_text"][0].get("text", {}).get("content", "")
-    
-    # Last Name
-    last_name_prop = properties.get("✅ Last Name", {})
-    if last_name_prop.get("rich_text") and len(last_name_prop["rich_text"]) > 0:
-        last_name = last_name_prop["rich_text"][0].get("text", {}).get("content", "")
+    get_property = properties.get
+    user_data = {field: extract(get_property(name, _MISSING_PROPERTY)) for field, name, extract in _PROPERTY_SPEC}
     
     # Normalize names (capitalize first letter)
-    first_name = capitalize_name(first_name)
-    last_name = capitalize_name(last_name)
-    
-    # Extract HubSpot Role from rollup
-    hubspot_role = ""
-    hubspot_role_prop = properties.get("✅ HubSpot Role", {})
-    if hubspot_role_prop.get("rollup") and hubspot_role_prop["rollup"].get("rollup_property"):
-        role_data = hubspot_role_prop["rollup"]["rollup_property"]
-        if role_data and len(role_data) > 0:
-            hubspot_role = role_data[0].get("select", {}).get("name", "")
-    
-    # Extract optional fields
-    phone = ""
-    phone_prop = properties.get("📝 Phone Number", {})
-    if phone_prop.get("phone_number"):
-        phone = phone_prop["phone_number"]
-    
-    # Get HubSpot tracking fields
-    hubspot_created = False
-    hubspot_created_prop = properties.get("📝 HubSpot Created", {})
-    if hubspot_created_prop.get("checkbox"):
-        hubspot_created = hubspot_created_prop["checkbox"]
-    
-    hubspot_user_id = ""
-    hubspot_user_id_prop = properties.get("📝 HubSpot User ID", {})
-    if hubspot_user_id_prop.get("rich_text") and len(hubspot_user_id_prop["rich_text"]) > 0:
-        hubspot_user_id = hubspot_user_id_prop["rich_text"][0].get("text", {}).get("content", "")
-    
-    return {
-        "email": email,
-        "first_name": first_name,
-        "last_name": last_name,
-        "hubspot_role": hubspot_role,
-        "phone": phone,
-        "hubspot_created": hubspot_created,
-        "hubspot_user_id": hubspot_user_id,
-        "notion_page_id": notion_user.get("id")
-    }
+    user_data["first_name"] = capitalize_name(user_data["first_name"])
+    user_data["last_name"] = capitalize_name(user_data["last_name"])
+    
+    # Hash of the fields written to HubSpot, compared with the one stored at
+    # the last sync to skip updates when nothing changed. Only pages whose
+    # database has the "📝 Sync Hash" property take part.
+    user_data["sync_hash"] = ""
+    user_data["previous_sync_hash"] = ""
+    sync_hash_prop = properties.get("📝 Sync Hash")
+    if sync_hash_prop is not None:
+        user_data["sync_hash"] = compute_sync_hash(user_data["email"], user_data["first_name"], user_data["last_name"])
+        user_data["previous_sync_hash"] = _rich_text_content(sync_hash_prop)
+    
+    user_data["notion_page_id"] = notion_user.get("id")
+    return user_data
+
+
+def compute_sync_hash(email: str, first_name: str, last_name: str) -> str:
+    """Short stable hash of the user fields that are synced to HubSpot"""
+    return hashlib.blake2b(f"{email}|{first_name}|{last_name}".encode(), digest_size=8).hexdigest()
 
 
 def create_user_in_hubspot(user_data: Dict) -> Optional[str]:
@@ -147,15 +195,15 @@ def create_user_in_hubspot(user_data: Dict) -> Optional[str]:
     Returns the HubSpot user ID if successful
     """
     if not HUBSPOT_ACCESS_TOKEN:
-        print("✗ Error: HUBSPOT_ACCESS_TOKEN not set in .env file")
+        logger.error("✗ Error: HUBSPOT_ACCESS_TOKEN not set in .env file")
         return None
     
     if not user_data.get("email"):
-        print("✗ Error: Email is required to create user in HubSpot")
+        logger.warning("✗ Error: Email is required to create user in HubSpot")
         return None
     
     if not user_data.get("first_name") and not user_data.get("last_name"):
-        print("✗ Warning: First Name or Last Name should be provided")
+        logger.warning("✗ Warning: First Name or Last Name should be provided")
     
     # HubSpot Users API endpoint
     url = f"{HUBSPOT_BASE_URL}/settings/v3/users"
@@ -188,24 +236,25 @@ def create_user_in_hubspot(user_data: Dict) -> Optional[str]:
         # payload["roleId"] = role_mapping.get(user_data["hubspot_role"])
         # For now, we'll create the user and assign role later via HubSpot UI or separate API call
     
-    response = requests.post(url, headers=HUBSPOT_HEADERS, json=payload)
+    response = hubspot_request("POST", url, data=orjson.dumps(payload))
     
     if response.status_code == 200 or response.status_code == 201:
-        hubspot_user = response.json()
+        hubspot_user = orjson.loads(response.content)
         hubspot_user_id = hubspot_user.get("id")
-        print(f"✅ Created user in HubSpot: {user_data['email']} (ID: {hubspot_user_id})")
+        logger.info("✅ Created user in HubSpot: %s (ID: %s)", user_data['email'], hubspot_user_id)
+        remember_hubspot_user_id(user_data["email"], str(hubspot_user_id))
         return str(hubspot_user_id)
     elif response.status_code == 409:
         # User already exists
-        error_data = response.json()
+        error_data = orjson.loads(response.content)
         message = error_data.get("message", "")
-        print(f"⚠ User already exists in HubSpot: {user_data['email']}")
-        print(f"  Message: {message}")
+        logger.warning("⚠ User already exists in HubSpot: %s", user_data['email'])
+        logger.debug("Message: %s", message)
         # Try to get existing user ID
         return get_hubspot_user_id_by_email(user_data["email"])
     else:
-        print(f"✗ Error creating user in HubSpot: {response.status_code}")
-        print(f"  Response: {response.text}")
+        log_error_response(logger, "Error creating user in HubSpot", response)
+        raise_for_transient_status("Error creating user in HubSpot", response)
         return None
 
 
@@ -214,15 +263,24 @@ def get_hubspot_user_id_by_email(email: str) -> Optional[str]:
     if not HUBSPOT_ACCESS_TOKEN:
         return None
     
+    with _EMAIL_CACHE_LOCK:
+        cached_id = _EMAIL_CACHE.get(email.lower())
+    if cached_id:
+        return cached_id
+    
     url = f"{HUBSPOT_BASE_URL}/settings/v3/users"
     params = {"email": email}
     
-    response = requests.get(url, headers=HUBSPOT_HEADERS, params=params)
+    response = hubspot_request("GET", url, params=params)
     
     if response.status_code == 200:
-        users = response.json().get("results", [])
+        users = orjson.loads(response.content).get("results", [])
         if users and len(users) > 0:
-            return str(users[0].get("id"))
+            hubspot_user_id = str(users[0].get("id"))
+            remember_hubspot_user_id(email, hubspot_user_id)
+            return hubspot_user_id
+    else:
+        raise_for_transient_status("Error looking up HubSpot user by email", response)
     
     return None
 
@@ -233,7 +291,7 @@ def update_user_in_hubspot(user_data: Dict, hubspot_user_id: str) -> bool:
     Returns True if successful
     """
     if not HUBSPOT_ACCESS_TOKEN:
-        print("✗ Error: HUBSPOT_ACCESS_TOKEN not set in .env file")
+        logger.error("✗ Error: HUBSPOT_ACCESS_TOKEN not set in .env file")
         return False
     
     url = f"{HUBSPOT_BASE_URL}/settings/v3/users/{hubspot_user_id}"
@@ -247,36 +305,42 @@ def update_user_in_hubspot(user_data: Dict, hubspot_user_id: str) -> bool:
         payload["email"] = user_data["email"]
     
     if not payload:
-        print("  ℹ️  No fields to update")
+        logger.debug("ℹ️  No fields to update")
         return True
     
     # HubSpot Settings Users API might require PUT instead of PATCH
     # Try PATCH first, fallback to PUT if 405
-    response = requests.patch(url, headers=HUBSPOT_HEADERS, json=payload)
+    response = hubspot_request("PATCH", url, data=orjson.dumps(payload))
     
     if response.status_code == 405:
         # Try PUT method instead
-        print(f"  ⚠️  PATCH not allowed, trying PUT...")
-        response = requests.put(url, headers=HUBSPOT_HEADERS, json=payload)
+        logger.debug("⚠️  PATCH not allowed, trying PUT...")
+        response = hubspot_request("PUT", url, data=orjson.dumps(payload))
     
     if response.status_code == 200:
-        print(f"✅ Updated user in HubSpot: {user_data.get('email', hubspot_user_id)}")
+        logger.info("✅ Updated user in HubSpot: %s", user_data.get('email', hubspot_user_id))
+        if user_data.get("email"):
+            remember_hubspot_user_id(user_data["email"], hubspot_user_id)
         return True
     else:
-        print(f"✗ Error updating user in HubSpot: {response.status_code}")
-        print(f"  Response: {response.text}")
-        print(f"  URL: {url}")
-        print(f"  Payload: {payload}")
+        log_error_response(logger, "Error updating user in HubSpot", response)
+        raise_for_transient_status("Error updating user in HubSpot", response)
+        logger.debug("URL: %s", url)
+        logger.debug("Payload: %s", payload)
         return False
 
 
 def update_notion_sync_status(
     notion_page_id: str,
     hubspot_user_id: str,
-    created: bool = False
+    created: bool = False,
+    sync_hash: str = ""
 ):
     """
     Update Notion page with HubSpot sync status
+    
+    The timestamps are taken now, but the PATCH itself runs in the background
+    (see write_notion_sync_status) so callers don't wait on Notion
     """
     if not NOTION_TOKEN:
         return
@@ -307,6 +371,17 @@ def update_notion_sync_status(
         }
     }
     
+    if sync_hash:
+        payload["properties"]["📝 Sync Hash"] = {
+            "rich_text": [
+                {
+                    "text": {
+                        "content": sync_hash
+                    }
+                }
+            ]
+        }
+    
     if created:
         payload["properties"]["📝 HubSpot Created Date"] = {
             "date": {
@@ -314,23 +389,84 @@ def update_notion_sync_status(
             }
         }
     
-    response = requests.patch(url, headers=NOTION_HEADERS, json=payload)
+    _STATUS_EXECUTOR.submit(write_notion_sync_status, url, payload)
+
+
+def write_notion_sync_status(url: str, payload: Dict) -> bool:
+    """
+    PATCH the sync status properties onto a Notion page
+    
+    429/5xx are retried by the session's urllib3 Retry (waiting out Retry-After);
+    other errors such as a 400 for a missing property are not worth retrying
+    """
+    try:
+        response = NOTION_SESSION.patch(url, data=orjson.dumps(payload), timeout=NOTION_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning("⚠ Warning: Could not update Notion sync status: %s", e)
+        return False
     
     if response.status_code == 200:
-        print(f"  ✅ Updated Notion sync status")
-    else:
-        print(f"  ⚠ Warning: Could not update Notion sync status: {response.status_code}")
+        logger.info("✅ Updated Notion sync status")
+        return True
+    
+    log_error_response(logger, "Could not update Notion sync status", response)
+    return False
 
 
-def sync_user_to_hubspot(notion_user_page_id: str) -> bool:
+def sync_user_to_hubspot(notion_user_page_id: str, notion_user: Optional[Dict] = None) -> bool:
     """
     Main function to sync a single user from Notion to HubSpot
     Returns True if successful
+    
+    notion_user can pass in a page that was already fetched (e.g. from a
+    database query) to skip fetching it again
+    
+    Concurrent calls for the same page share one sync: later callers wait for
+    the running one, which then runs once more (re-fetching the page) so
+    changes that arrived mid-sync are not lost.
+    
+    Raises TransientAPIError when Notion or HubSpot still answer 429/5xx after
+    the session's retries, so callers can tell it apart from a bad page
     """
-    print(f"\n🔄 Syncing user {notion_user_page_id[:8]}... to HubSpot")
+    with _INFLIGHT_SYNC_LOCK:
+        in_flight = _INFLIGHT_SYNCS.get(notion_user_page_id)
+        if in_flight is None:
+            future: Future = Future()
+            _INFLIGHT_SYNCS[notion_user_page_id] = future
+        else:
+            _PENDING_RESYNCS.add(notion_user_page_id)
+    
+    if in_flight is not None:
+        logger.debug("⏳ Sync of %s... already in progress, waiting for it", notion_user_page_id[:8])
+        return in_flight.result()
+    
+    try:
+        while True:
+            synced = _sync_user_to_hubspot(notion_user_page_id, notion_user)
+            with _INFLIGHT_SYNC_LOCK:
+                if notion_user_page_id not in _PENDING_RESYNCS:
+                    _INFLIGHT_SYNCS.pop(notion_user_page_id, None)
+                    break
+                _PENDING_RESYNCS.discard(notion_user_page_id)
+            # Another event came in for this page while it was syncing
+            notion_user = None
+        future.set_result(synced)
+        return synced
+    except Exception as e:
+        with _INFLIGHT_SYNC_LOCK:
+            _INFLIGHT_SYNCS.pop(notion_user_page_id, None)
+            _PENDING_RESYNCS.discard(notion_user_page_id)
+        future.set_exception(e)
+        raise
+
+
+def _sync_user_to_hubspot(notion_user_page_id: str, notion_user: Optional[Dict]) -> bool:
+    """Sync a single user from Notion to HubSpot (see sync_user_to_hubspot)"""
+    logger.debug("🔄 Syncing user %s... to HubSpot", notion_user_page_id[:8])
     
     # Step 1: Get user from Notion
-    notion_user = get_notion_user(notion_user_page_id)
+    if notion_user is None:
+        notion_user = get_notion_user(notion_user_page_id)
     if not notion_user:
         return False
     
@@ -339,93 +475,147 @@ def sync_user_to_hubspot(notion_user_page_id: str) -> bool:
     
     # Validate required fields
     if not user_data.get("email"):
-        print("✗ Error: User must have an email address")
+        logger.warning("✗ Error: User must have an email address")
         return False
     
     if not user_data.get("first_name") and not user_data.get("last_name"):
-        print("✗ Error: User must have at least First Name or Last Name")
+        logger.warning("✗ Error: User must have at least First Name or Last Name")
         return False
     
     # Step 3: Check if user already exists in HubSpot
     hubspot_user_id = user_data.get("hubspot_user_id")
     hubspot_created = user_data.get("hubspot_created", False)
     
+    sync_hash = user_data.get("sync_hash", "")
+    
     if hubspot_created and hubspot_user_id:
+        # Nothing synced to HubSpot changed since the last sync
+        if sync_hash and sync_hash == user_data.get("previous_sync_hash"):
+            logger.debug("ℹ️  No changes since last sync (ID: %s), skipping update", hubspot_user_id)
+            return True
+        
         # User already synced - update instead
-        print(f"  ℹ️  User already exists in HubSpot (ID: {hubspot_user_id}), updating...")
+        logger.debug("ℹ️  User already exists in HubSpot (ID: %s), updating...", hubspot_user_id)
         success = update_user_in_hubspot(user_data, hubspot_user_id)
         if success:
-            update_notion_sync_status(notion_user_page_id, hubspot_user_id, created=False)
+            update_notion_sync_status(notion_user_page_id, hubspot_user_id, created=False, sync_hash=sync_hash)
         return success
     else:
         # New user - create in HubSpot
-        print(f"  ✨ Creating new user in HubSpot...")
+        logger.debug("✨ Creating new user in HubSpot...")
         hubspot_user_id = create_user_in_hubspot(user_data)
         
         if hubspot_user_id:
-            update_notion_sync_status(notion_user_page_id, hubspot_user_id, created=True)
+            update_notion_sync_status(notion_user_page_id, hubspot_user_id, created=True, sync_hash=sync_hash)
             return True
         else:
             return False
 
 
-def sync_all_users_from_notion(users_database_id: str) -> Dict:
+def iter_notion_database(database_id: str, query_filter: Optional[Dict] = None) -> Iterator[Dict]:
     """
-    Sync all users from Notion Users database to HubSpot
-    Useful for initial sync or manual sync
-    """
-    if not NOTION_TOKEN:
-        print("✗ Error: NOTION_TOKEN not set")
-        return {"success": 0, "failed": 0}
-    
-    print("\n" + "=" * 60)
-    print("Syncing all users from Notion to HubSpot")
-    print("=" * 60)
+    Yield the pages of a Notion database (paginated) as they arrive, optionally filtered
     
-    url = f"{NOTION_BASE_URL}/databases/{users_database_id}/query"
+    Raises TransientAPIError (429/5xx) or requests.HTTPError at the first failed
+    request, so callers can tell a partial result from the whole database
+    """
+    url = f"{NOTION_BASE_URL}/databases/{database_id}/query"
     
-    all_users = []
     start_cursor = None
     
-    # Get all users (paginated)
     while True:
-        payload = {}
+        payload: Dict = {"page_size": 100}
+        if query_filter:
+            payload["filter"] = query_filter
         if start_cursor:
             payload["start_cursor"] = start_cursor
         
-        response = requests.post(url, headers=NOTION_HEADERS, json=payload)
+        response = NOTION_SESSION.post(url, data=orjson.dumps(payload), timeout=NOTION_TIMEOUT)
         
         if response.status_code != 200:
-            print(f"✗ Error querying database: {response.status_code}")
-            print(f"  Response: {response.text}")
-            break
+            log_error_response(logger, "Error querying database", response)
+            raise_for_transient_status("Error querying database", response)
+            raise requests.HTTPError(f"Error querying database: {response.status_code}", response=response)
         
-        data = response.json()
-        results = data.get("results", [])
-        all_users.extend(results)
+        data = orjson.loads(response.content)
+        yield from data.get("results", [])
         
         if data.get("has_more"):
             start_cursor = data.get("next_cursor")
         else:
-            break
-    
-    print(f"\n📊 Found {len(all_users)} user(s) in Notion")
-    
-    success_count = 0
-    failed_count = 0
-    
-    for user in all_users:
-        user_id = user.get("id")
-        if sync_user_to_hubspot(user_id):
-            success_count += 1
-        else:
-            failed_count += 1
+            return
+
+
+def sync_all_users_from_notion(users_database_id: str) -> Dict:
+    """
+    Sync all users from Notion Users database to HubSpot
+    Useful for initial sync or manual sync
     
-    print("\n" + "=" * 60)
-    print(f"Sync Complete: {success_count} succeeded, {failed_count} failed")
-    print("=" * 60)
+    "complete" is False when querying the database failed part way, so only
+    some of its users were synced
+    """
+    if not NOTION_TOKEN:
+        logger.error("✗ Error: NOTION_TOKEN not set")
+        return {"success": 0, "failed": 0, "complete": False}
+    
+    logger.info("Syncing all users from Notion to HubSpot")
+    
+    # Users are synced while the database is still being paginated: the query
+    # feeds a bounded queue drained by SYNC_CONCURRENCY workers, so at most
+    # SYNC_QUEUE_SIZE pages are held in memory at once
+    users: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=SYNC_QUEUE_SIZE)
+    counts = {"success": 0, "failed": 0}
+    counts_lock = Lock()
+    
+    def sync_worker():
+        while True:
+            user = users.get()
+            if user is None:
+                return
+            try:
+                # The database query already returned full pages, so they are not fetched again
+                synced = sync_user_to_hubspot(user.get("id"), user)
+            except Exception as e:
+                logger.warning("✗ Error syncing user: %s", e)
+                synced = False
+            with counts_lock:
+                counts["success" if synced else "failed"] += 1
+    
+    workers = [
+        Thread(target=sync_worker, name=f"notion-sync-{i}", daemon=True)
+        for i in range(SYNC_CONCURRENCY)
+    ]
+    for worker in workers:
+        worker.start()
+    
+    complete = True
+    try:
+        # One unfiltered cursor chain: syncing changes the pages' properties, so
+        # a filtered query could skip pages or return them twice mid-sync
+        for user in iter_notion_database(users_database_id):
+            users.put(user)
+    except Exception as e:
+        logger.error("✗ Error reading the Users database, stopping after the pages read so far: %s", e)
+        complete = False
+    finally:
+        for _ in workers:
+            users.put(None)
+        for worker in workers:
+            worker.join()
+    
+    success_count = counts["success"]
+    failed_count = counts["failed"]
+    
+    logger.info("📊 Found %s user(s) in Notion", success_count + failed_count)
+    if complete:
+        logger.info("Sync Complete: %s succeeded, %s failed", success_count, failed_count)
+    else:
+        logger.warning(
+            "⚠ Sync Incomplete: %s succeeded, %s failed before the database query failed",
+            success_count, failed_count
+        )
     
-    return {"success": success_count, "failed": failed_count}
+    return {"success": success_count, "failed": failed_count, "complete": complete}
 
 
 def main():
@@ -459,5 +649,6 @@ def main():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
     main()
 
@@ -3,179 +3,289 @@ Notion Webhook Handler
 Handles webhook events from Notion to automatically sync users to HubSpot
 
 Usage:
-1. Set up a webhook endpoint (using Flask, FastAPI, or similar)
+1. Set up a webhook endpoint (webhook_server.py serves /notion-webhook with Flask)
 2. Configure Notion webhook to send events to your endpoint
 3. This handler processes page.created and page.updated events
 """
 
 from notion_hubspot_sync import sync_user_to_hubspot
-import json
+import hashlib
+import hmac
+import logging
+import orjson
 import os
-from typing import Dict, Optional
+from functools import lru_cache
+from threading import Lock
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
+# Redis is only needed when event dedup is shared between processes (REDIS_URL)
+try:
+    import redis  # type: ignore[import-not-found]
+except ImportError:
+    redis = None  # type: ignore[assignment]
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Get Users database ID from environment
 USERS_DATABASE_ID = os.getenv("NOTION_USERS_DATABASE_ID", None)
 
+# Users database ID without hyphens and lowercased (Notion IDs can have
+# different formats), normalized once here instead of on every event
+_USERS_DB_ID_NORMALIZED = (USERS_DATABASE_ID or "").replace("-", "").lower() or None
+
+# Verification token Notion gave when the webhook subscription was verified;
+# when set, POSTed events must carry a matching X-Notion-Signature
+NOTION_WEBHOOK_SECRET = os.getenv("NOTION_WEBHOOK_SECRET")
+_NOTION_WEBHOOK_KEY = NOTION_WEBHOOK_SECRET.encode() if NOTION_WEBHOOK_SECRET else None
+
+# Shared read-only default for missing event fields
+_EMPTY: Mapping = MappingProxyType({})
+
+# Notion event types that can create or change a user page
+_SUPPORTED_TYPES = frozenset({"page.created", "page.updated", "page.properties_updated"})
+
+# IDs of recently handled events, so Notion redeliveries are not synced twice
+NOTION_EVENT_DEDUP_TTL = float(os.getenv("NOTION_EVENT_DEDUP_TTL", "86400"))
+_SEEN_EVENTS: TTLCache = TTLCache(maxsize=10000, ttl=NOTION_EVENT_DEDUP_TTL)
+_SEEN_EVENTS_LOCK = Lock()
+
+# Optional Redis (REDIS_URL) that shares the seen events between worker processes
+REDIS_URL = os.getenv("REDIS_URL")
+_REDIS = redis.Redis.from_url(REDIS_URL, socket_timeout=0.1) if redis is not None and REDIS_URL else None
+
+
+def verify_notion_signature(body: bytes, signature: Optional[str]) -> bool:
+    """
+    Check an X-Notion-Signature header ("sha256=<hex HMAC of the raw body>")
+    
+    Always True when no NOTION_WEBHOOK_SECRET is configured
+    """
+    if _NOTION_WEBHOOK_KEY is None:
+        return True
+    if not signature:
+        return False
+    expected = "sha256=" + hmac.new(_NOTION_WEBHOOK_KEY, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def is_sync_event(event: Dict) -> bool:
+    """Check if a Notion event is of a type that can create or change a user page"""
+    return event.get("type") in _SUPPORTED_TYPES
+
 
 def is_user_page(event: Dict) -> bool:
     """Check if the event is for a user page in the Users database"""
+    return _is_user_page(event.get("entity") or _EMPTY, event.get("data") or _EMPTY)
+
+
+def _is_user_page(entity: Mapping, event_data: Mapping) -> bool:
+    """is_user_page for an event's already extracted entity and data objects"""
     # Notion webhook structure has two possible formats:
     # 1. event.data.object.parent (for page.created/updated)
     # 2. event.data.parent (for page.properties_updated)
     
-    event_data = event.get("data", {})
-    
     # Check if it's a page entity
-    entity = event.get("entity", {})
     if entity.get("type") != "page":
         return False
     
     # Get parent database info
-    parent = event_data.get("parent", {})
+    parent = event_data.get("parent") or _EMPTY
     if not parent:
         # Try alternative structure (for page.created/updated)
-        page_obj = event_data.get("object", {})
-        parent = page_obj.get("parent", {})
+        page_obj = event_data.get("object") or _EMPTY
+        parent = page_obj.get("parent") or _EMPTY
     
     # Check parent type
-    if parent.get("type") == "database" or parent.get("type") == "database_id":
+    parent_type = parent.get("type")
+    if parent_type == "database" or parent_type == "database_id":
         # Get database ID
         database_id = parent.get("id") or parent.get("database_id")
         
         if not database_id:
             return False
         
-        # If we have the Users database ID, check if it matches
-        if USERS_DATABASE_ID:
-            # Remove hyphens for comparison (Notion IDs can have different formats)
-            db_id_normalized = database_id.replace("-", "") if database_id else ""
-            users_db_id_normalized = USERS_DATABASE_ID.replace("-", "")
-            return db_id_normalized == users_db_id_normalized
-        else:
-            # If no database ID configured, accept all database pages (not ideal)
-            return True
+        return is_users_database(database_id)
     
     return False
 
 
+@lru_cache(maxsize=1024)
+def is_users_database(database_id: str) -> bool:
+    """
+    Check if a parent database ID is the Users database
+    
+    Cached per raw ID, so events from other databases are rejected with a
+    single lookup after the first one
+    """
+    # Without a configured Users database no page can be matched, so fail closed
+    if not _USERS_DB_ID_NORMALIZED:
+        logger.warning("⚠️  NOTION_USERS_DATABASE_ID not set, ignoring pages from database %s", database_id)
+        return False
+    
+    # Remove hyphens for comparison (Notion IDs can have different formats)
+    return database_id.replace("-", "").lower() == _USERS_DB_ID_NORMALIZED
+
+
 def handle_notion_webhook(event: Dict) -> Dict:
     """
     Handle a webhook event from Notion
     Returns a response dict with status
     """
-    print(f"   🔍 Processing webhook event...")
+    page_id, result = screen_notion_webhook(event)
+    if result is not None:
+        return result
     
-    event_type = event.get("type")
-    print(f"   📋 Event type: {event_type}")
+    result = sync_notion_page(page_id)
+    if result["status"] == "error":
+        # Let Notion's redelivery of this event try again
+        release_notion_event(event)
+    return result
+
+
+def notion_event_id(event: Dict) -> str:
+    """Notion's event ID, or a hash of the whole event if it has none"""
+    event_id = event.get("id")
+    if event_id:
+        return str(event_id)
+    return hashlib.blake2b(orjson.dumps(event, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def claim_notion_event(event: Dict) -> bool:
+    """
+    Mark an event as seen; returns False if it was already seen (a redelivery)
     
-    # Support multiple event types
-    supported_types = ["page.created", "page.updated", "page.properties_updated"]
-    if event_type not in supported_types:
-        print(f"   ⏭️  Ignoring event type: {event_type}")
-        return {
+    Uses Redis when REDIS_URL is configured so every worker process shares the
+    seen events, falling back to the in-process cache if Redis is unavailable
+    """
+    event_id = notion_event_id(event)
+    if _REDIS is not None:
+        try:
+            return bool(_REDIS.set(f"notion-event:{event_id}", b"1", nx=True, ex=int(NOTION_EVENT_DEDUP_TTL)))
+        except redis.RedisError as e:
+            logger.warning("⚠️  Redis unavailable for event dedup, using local cache: %s", e)
+    
+    with _SEEN_EVENTS_LOCK:
+        if event_id in _SEEN_EVENTS:
+            return False
+        _SEEN_EVENTS[event_id] = True
+        return True
+
+
+def release_notion_event(event: Dict) -> None:
+    """Forget an event that could not be processed, so a redelivery is handled again"""
+    event_id = notion_event_id(event)
+    if _REDIS is not None:
+        try:
+            _REDIS.delete(f"notion-event:{event_id}")
+        except redis.RedisError as e:
+            logger.warning("⚠️  Redis unavailable for event dedup: %s", e)
+    
+    with _SEEN_EVENTS_LOCK:
+        _SEEN_EVENTS.pop(event_id, None)
+
+
+def screen_notion_webhook(event: Dict) -> Tuple[str, Optional[Dict]]:
+    """
+    Work out whether a Notion webhook event needs a user sync, without syncing
+    
+    Returns:
+        Tuple of (page_id, result); result is a response dict (and page_id is "")
+        when the event should not be processed any further
+    """
+    # Reject unsupported event types before doing any other work
+    event_type = event.get("type")
+    if not is_sync_event(event):
+        logger.debug("⏭️  Ignoring event type: %s", event_type)
+        return ("", {
             "status": "ignored",
             "message": f"Event type {event_type} not handled"
-        }
+        })
+    
+    logger.debug("🔍 Processing webhook event...")
+    logger.debug("📋 Event type: %s", event_type)
     
-    # Get page ID from entity or data.object
-    entity = event.get("entity", {})
-    event_data = event.get("data", {})
+    # Get page ID from entity or data.object (both looked up once and reused below)
+    entity = event.get("entity") or _EMPTY
+    event_data = event.get("data") or _EMPTY
     
     # Extract page ID
     if entity.get("type") == "page":
         page_id = entity.get("id")
-        print(f"   📄 Page from entity: {page_id}")
+        logger.debug("📄 Page from entity: %s", page_id)
     else:
         # Fallback to data.object structure
-        page_obj = event_data.get("object", {})
+        page_obj = event_data.get("object") or _EMPTY
         page_id = page_obj.get("id")
-        print(f"   📄 Page from data.object: {page_id}")
+        logger.debug("📄 Page from data.object: %s", page_id)
     
     # Get page ID first
     if not page_id:
-        print(f"   ❌ No page ID found")
-        return {
+        logger.warning("❌ No page ID found")
+        return ("", {
             "status": "error",
             "message": "No page ID found in event"
-        }
+        })
     
-    print(f"   🆔 Page ID: {page_id}")
+    logger.debug("🆔 Page ID: %s", page_id)
     
     # Check if it's a user page
-    is_user = is_user_page(event)
-    print(f"   👤 Is user page: {is_user}")
+    is_user = _is_user_page(entity, event_data)
+    logger.debug("👤 Is user page: %s", is_user)
     
     if not is_user:
-        print(f"   ⏭️  Not a user page, ignoring")
-        return {
+        logger.debug("⏭️  Not a user page, ignoring")
+        return ("", {
             "status": "ignored",
             "message": "Not a user page"
-        }
+        })
+    
+    # Notion redelivers events it considers unanswered; each one is synced once
+    if not claim_notion_event(event):
+        logger.debug("⏭️  Event already processed, ignoring redelivery")
+        return ("", {
+            "status": "duplicate",
+            "message": f"Event for page {page_id} already processed"
+        })
     
-    print(f"   🔄 Starting sync to HubSpot...")
+    return (page_id, None)
+
+
+def sync_notion_page(page_id: str) -> Dict:
+    """
+    Sync one Notion user page to HubSpot
+    Returns a response dict with status
+    """
+    logger.debug("🔄 Starting sync to HubSpot...")
     
     # Sync to HubSpot
     try:
         success = sync_user_to_hubspot(page_id)
         if success:
-            print(f"   ✅ Successfully synced to HubSpot")
+            logger.info("✅ Successfully synced to HubSpot")
             return {
                 "status": "success",
                 "message": f"User {page_id} synced to HubSpot",
                 "page_id": page_id
             }
         else:
-            print(f"   ❌ Failed to sync to HubSpot")
+            logger.warning("❌ Failed to sync to HubSpot")
             return {
                 "status": "error",
                 "message": f"Failed to sync user {page_id}",
                 "page_id": page_id
             }
     except Exception as e:
-        print(f"   ❌ Exception: {str(e)}")
+        # Only exceptions (network errors, Notion/HubSpot 429/5xx) are worth
+        # retrying; a False result above is a problem with the page itself
+        logger.warning("❌ Exception: %s", e)
         return {
             "status": "error",
             "message": f"Exception syncing user: {str(e)}",
-            "page_id": page_id
+            "page_id": page_id,
+            "retry_event": page_id
         }
-
-
-# Example Flask webhook endpoint (uncomment and adapt if using Flask)
-"""
-from flask import Flask, request, jsonify
-
-app = Flask(__name__)
-
-@app.route('/notion-webhook', methods=['POST'])
-def notion_webhook():
-    event = request.json
-    result = handle_notion_webhook(event)
-    return jsonify(result), 200 if result["status"] in ["success", "ignored"] else 500
-
-if __name__ == '__main__':
-    app.run(port=5000, debug=True)
-"""
-
-
-# Example FastAPI webhook endpoint (uncomment and adapt if using FastAPI)
-"""
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-
-app = FastAPI()
-
-@app.post('/notion-webhook')
-async def notion_webhook(request: Request):
-    event = await request.json()
-    result = handle_notion_webhook(event)
-    status_code = 200 if result["status"] in ["success", "ignored"] else 500
-    return JSONResponse(content=result, status_code=status_code)
-
-if __name__ == '__main__':
-    import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=5000)
-"""
-
@@ -0,0 +1,223 @@
+"""
+Shared helpers used by the Notion and HubSpot webhook modules
+"""
+
+import atexit
+import logging
+import os
+import random
+import string
+import time
+from functools import lru_cache
+from threading import Lock
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Try to load from .env file if python-dotenv is available (the HubSpot
+# settings below are read at import)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+
+# Translation table that uppercases ASCII letters, built once for capitalize_name
+_ASCII_UPPER = str.maketrans(string.ascii_lowercase, string.ascii_uppercase)
+
+
+@lru_cache(maxsize=4096)
+def capitalize_name(name: str) -> str:
+    """
+    Capitalize the first letter of a name
+    
+    Examples:
+        "john" → "John"
+        "mary jane" → "Mary jane"
+        "O'CONNOR" → "O'connor"
+        "" → ""
+    """
+    # Fast path for the common already-normalized case (e.g. HubSpot echoing our own update)
+    if not name or (name[0].isupper() and not name[-1].isspace()):
+        return name
+    
+    # Only strip (and allocate) when there is surrounding whitespace
+    if name[0].isspace() or name[-1].isspace():
+        stripped = name.strip()
+        if not stripped:
+            return name
+        name = stripped
+    
+    # Capitalize first letter, keep rest as-is; already-capitalized names are returned as-is.
+    # ASCII letters go through the precomputed table, anything else through str.upper()
+    first = name[0]
+    upper = first.translate(_ASCII_UPPER) if first.isascii() else first.upper()
+    return name if first == upper else upper + name[1:]
+
+
+def log_error_response(logger: logging.Logger, message: str, response: requests.Response) -> None:
+    """Log a failed API call; the (truncated) body is only decoded when DEBUG is on"""
+    logger.warning("✗ %s: %s", message, response.status_code)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response body: %s", response.content[:512].decode("utf-8", "replace"))
+
+
+# Statuses that mean "try again later" rather than "this request is wrong"
+TRANSIENT_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TransientAPIError(Exception):
+    """A Notion/HubSpot request still failed with 429/5xx after the session's own retries"""
+
+
+def raise_for_transient_status(message: str, response: requests.Response) -> None:
+    """Raise TransientAPIError if a failed response is worth retrying later"""
+    if response.status_code in TRANSIENT_STATUSES:
+        raise TransientAPIError(f"{message}: {response.status_code}")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Holds up to `capacity` tokens and refills at `rate` tokens per second.
+    Each admitted unit of work consumes one token.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, tokens: float = 1) -> bool:
+        """Take `tokens` from the bucket; returns False (taking nothing) if there are not enough"""
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Block until `tokens` can be taken from the bucket, then take them"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def retry_after(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` will be available"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+
+class RateLimitedRetry(Retry):
+    """
+    urllib3 Retry that takes a token from a TokenBucket before each retry
+
+    urllib3 resends inside HTTPAdapter.send, so without this only the first
+    attempt of a request would be throttled.
+    """
+
+    limiter: Optional[TokenBucket] = None
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.limiter = self.limiter
+        return retry
+
+    def sleep(self, response=None) -> None:
+        super().sleep(response)
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that takes a token from a TokenBucket before sending each request and each of its retries"""
+
+    def __init__(self, limiter: TokenBucket, max_retries: RateLimitedRetry, **kwargs):
+        self.limiter = limiter
+        # Copy so a retry policy shared between adapters keeps its own limiter
+        max_retries = max_retries.new()
+        max_retries.limiter = limiter
+        super().__init__(max_retries=max_retries, **kwargs)
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        return super().send(request, **kwargs)
+
+
+# Client-side throttle shared by every HubSpot call in this process, so bursts
+# stay under HubSpot's rate limit (100 requests / 10 s for private apps)
+# instead of running into 429s
+HUBSPOT_RATE_LIMIT = float(os.getenv("HUBSPOT_RATE_LIMIT", "9"))
+HUBSPOT_RATE_LIMITER = TokenBucket(HUBSPOT_RATE_LIMIT, HUBSPOT_RATE_LIMIT)
+
+# Same for Notion, which allows an average of 3 requests per second per integration
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))
+NOTION_RATE_LIMITER = TokenBucket(NOTION_RATE_LIMIT, NOTION_RATE_LIMIT)
+
+
+HUBSPOT_ACCESS_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN", None)
+HUBSPOT_BASE_URL = "https://api.hubapi.com"
+
+HUBSPOT_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {HUBSPOT_ACCESS_TOKEN}"
+}
+
+# Seconds to wait for HubSpot before giving up on a request, so a stalled
+# API call cannot hold a webhook worker thread indefinitely
+HUBSPOT_TIMEOUT = 10.0
+
+
+class JitteredRetry(RateLimitedRetry):
+    """urllib3 Retry with full-jitter backoff, so workers retrying at the same time spread out"""
+
+    def get_backoff_time(self) -> float:
+        return random.uniform(0, super().get_backoff_time())
+
+
+# Rate limits and transient errors are retried with jittered exponential
+# backoff (honoring Retry-After). Name updates and batch calls are idempotent,
+# and a user create that already went through comes back as a 409, so
+# PATCH/PUT/POST are retried too; once retries run out the last response is
+# returned and handled like any other error status.
+HUBSPOT_RETRY = JitteredRetry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=tuple(TRANSIENT_STATUSES),
+    allowed_methods=frozenset({"GET", "PATCH", "PUT", "POST"}),
+    respect_retry_after_header=True,
+    raise_on_status=False
+)
+
+# The one HubSpot session for the process (webhook handler and Notion sync),
+# so every call reuses pooled keep-alive connections to api.hubapi.com
+# instead of paying a TCP+TLS handshake per request. Auth headers are set once here.
+HUBSPOT_SESSION = requests.Session()
+HUBSPOT_SESSION.headers.update(HUBSPOT_HEADERS)
+# Auth comes from the headers above, so skip requests' per-call ~/.netrc and
+# proxy environment lookups
+HUBSPOT_SESSION.trust_env = False
+HUBSPOT_SESSION.mount("https://", RateLimitedAdapter(
+    HUBSPOT_RATE_LIMITER,
+    pool_connections=10,
+    pool_maxsize=100,
+    max_retries=HUBSPOT_RETRY
+))
+atexit.register(HUBSPOT_SESSION.close)
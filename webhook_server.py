@@ -6,28 +6,236 @@ Run this server and set up Notion webhook to point to it
 """
 
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
+import heapq
+import itertools
+import logging
+import math
+import orjson
 import os
+import queue
+import threading
+import time
+from typing import List, Tuple
 from dotenv import load_dotenv
-from notion_webhook_handler import handle_notion_webhook
-from hubspot_webhook_handler import handle_hubspot_user_webhook
+from notion_webhook_handler import (
+    is_sync_event, release_notion_event, screen_notion_webhook, sync_notion_page, verify_notion_signature
+)
+from hubspot_webhook_handler import admit_hubspot_webhook, handle_hubspot_user_webhook
 
 # Load environment variables
 load_dotenv()
 
+# Handler modules log through the standard logging module; per-event
+# tracing is emitted at DEBUG so it costs nothing at the default INFO level
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (used by jsonify)"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Build the response from orjson's bytes directly instead of going
+        # through dumps() and re-encoding the str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # Configuration
 # Railway and other cloud services set PORT environment variable
 PORT = int(os.getenv("PORT", os.getenv("WEBHOOK_PORT", "5000")))
 HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+# Flask debug mode (debugger + reloader) is opt-in for local development only
+DEBUG = os.getenv("FLASK_DEBUG") == "1"
+
+# Webhook payloads are small; larger bodies are rejected with 413 before they are read
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(256 * 1024)))
+app.config["MAX_CONTENT_LENGTH"] = WEBHOOK_MAX_BODY_BYTES
+
+# Webhook events are acknowledged right away and put on a bounded queue that
+# WEBHOOK_WORKERS threads drain; when the queue is full new webhooks get a 429
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+webhook_queue: queue.Queue = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+
+# Failed background events are retried with exponential backoff:
+# WEBHOOK_RETRY_DELAY seconds, then twice that, and so on
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", "5"))
+WEBHOOK_RETRY_DELAY = float(os.getenv("WEBHOOK_RETRY_DELAY", "30"))
+
+# Events waiting for their retry: a heap of (due time, sequence, queue item)
+# served by a single scheduler thread rather than one timer thread per event
+_retry_heap: List[Tuple[float, int, Tuple]] = []
+_retry_condition = threading.Condition()
+_retry_sequence = itertools.count()
+
+
+def run_background_event(source: str, handler, event, attempt: int):
+    """
+    Process one queued webhook event, log the outcome and schedule a retry
+    (with exponential backoff) if it failed for a transient reason
+    
+    A handler asks for a retry by returning the payload to process again as
+    "retry_event" (e.g. only the failed events of a batch); an exception
+    retries the whole event. Other errors (bad payloads, missing pages, ...)
+    are not retried.
+    """
+    try:
+        result = handler(event)
+        logger.info("📬 %s webhook processed: %s - %s", source, result.get("status"), result.get("message"))
+        retry_event = result.get("retry_event")
+    except Exception as e:
+        logger.warning("❌ %s webhook failed in background: %s", source, e)
+        retry_event = event
+    
+    if retry_event is None:
+        return
+    if attempt > WEBHOOK_MAX_RETRIES:
+        logger.warning("⚠️  Giving up on %s webhook after %s retries", source, WEBHOOK_MAX_RETRIES)
+        return
+    
+    delay = WEBHOOK_RETRY_DELAY * (2 ** (attempt - 1))
+    logger.info("🔁 Retrying %s webhook in %.0fs (retry %s/%s)", source, delay, attempt, WEBHOOK_MAX_RETRIES)
+    schedule_retry(delay, (source, handler, retry_event, attempt + 1))
+
+
+def schedule_retry(delay: float, item: Tuple) -> None:
+    """Hand a failed event to the retry scheduler thread, to be re-queued after `delay` seconds"""
+    with _retry_condition:
+        if len(_retry_heap) >= WEBHOOK_QUEUE_SIZE:
+            logger.warning("⚠️  Retry backlog full, dropping %s event", item[0])
+            return
+        heapq.heappush(_retry_heap, (time.monotonic() + delay, next(_retry_sequence), item))
+        _retry_condition.notify()
+
+
+def retry_scheduler():
+    """Scheduler thread: put failed events back on the queue once their backoff has passed"""
+    while True:
+        with _retry_condition:
+            while not _retry_heap or _retry_heap[0][0] > time.monotonic():
+                _retry_condition.wait(_retry_heap[0][0] - time.monotonic() if _retry_heap else None)
+            _, _, item = heapq.heappop(_retry_heap)
+        process_in_background(*item)
+
+
+def webhook_worker():
+    """Worker thread: process queued webhook events forever"""
+    while True:
+        source, handler, event, attempt = webhook_queue.get()
+        try:
+            run_background_event(source, handler, event, attempt)
+        finally:
+            webhook_queue.task_done()
+
+
+def process_in_background(source: str, handler, event, attempt: int = 1) -> bool:
+    """
+    Queue a webhook event for the worker threads so the request can be acknowledged immediately
+    
+    Returns:
+        False if the queue is full and the event was not queued
+    """
+    try:
+        webhook_queue.put_nowait((source, handler, event, attempt))
+        return True
+    except queue.Full:
+        logger.warning("⚠️  Webhook queue full, dropping %s event (attempt %s)", source, attempt)
+        return False
+
+
+for worker_number in range(WEBHOOK_WORKERS):
+    threading.Thread(target=webhook_worker, name=f"webhook-{worker_number}", daemon=True).start()
+threading.Thread(target=retry_scheduler, name="webhook-retry", daemon=True).start()
+
+
+# Bodies of responses that never change, serialized once here instead of on every request
+_HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "service": "Notion to HubSpot User Sync Webhook"
+})
+_NOTION_READY_BODY = orjson.dumps({
+    "status": "ready",
+    "message": "Webhook endpoint is ready to receive events",
+    "endpoint": "/notion-webhook"
+})
+_HUBSPOT_READY_BODY = orjson.dumps({
+    "status": "ready",
+    "message": "HubSpot webhook endpoint is ready to receive events",
+    "endpoint": "/hubspot-webhook"
+})
+_ENDPOINT_READY_BODY = orjson.dumps({
+    "status": "ready",
+    "message": "Endpoint is ready"
+})
+_TOO_LARGE_BODY = orjson.dumps({
+    "status": "error",
+    "message": "Request body too large"
+})
+_INVALID_SIGNATURE_BODY = orjson.dumps({
+    "status": "error",
+    "message": "Invalid webhook signature"
+})
+_QUEUE_FULL_BODY = orjson.dumps({
+    "status": "rate_limited",
+    "message": "Webhook queue is full, retry later"
+})
+_HOME_BODY = orjson.dumps({
+    "service": "Notion to HubSpot User Sync Webhook",
+    "endpoints": {
+        "/notion-webhook": "POST - Webhook endpoint for Notion events (syncs users to HubSpot)",
+        "/hubspot-webhook": "POST - Webhook endpoint for HubSpot events (normalizes names)",
+        "/health": "GET - Health check"
+    },
+    "instructions": {
+        "1": "Notion webhook: Configure in Notion → https://your-server.com/notion-webhook",
+        "2": "HubSpot webhook: Configure in HubSpot → https://your-server.com/hubspot-webhook",
+        "3": "HubSpot webhook normalizes user names (capitalizes first letters)"
+    }
+})
+
+
+def fixed_response(body: bytes, status: int = 200):
+    """JSON response for a body serialized ahead of time"""
+    return app.response_class(body, status=status, mimetype="application/json")
+
+
+def queue_full_response():
+    """429 telling the sender to retry once the webhook queue has drained"""
+    response = fixed_response(_QUEUE_FULL_BODY, 429)
+    response.headers["Retry-After"] = str(math.ceil(WEBHOOK_RETRY_DELAY))
+    return response
+
+
+@app.before_request
+def reject_oversized_body():
+    """
+    Turn away bodies over WEBHOOK_MAX_BODY_BYTES by their Content-Length, before routing reads them
+    
+    Chunked bodies carry no Content-Length and are cut off at the limit when read,
+    so the routes also reject a body that fills the whole limit.
+    """
+    if request.content_length is not None and request.content_length > WEBHOOK_MAX_BODY_BYTES:
+        return fixed_response(_TOO_LARGE_BODY, 413)
+
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "service": "Notion to HubSpot User Sync Webhook"
-    }), 200
+    return fixed_response(_HEALTH_BODY)
 
 @app.route('/notion-webhook', methods=['GET', 'POST'])
 def notion_webhook():
@@ -39,36 +247,42 @@ def notion_webhook():
     if request.method == 'GET':
         # Notion may send a verification request
         # Return 200 to confirm endpoint is working
-        return jsonify({
-            "status": "ready",
-            "message": "Webhook endpoint is ready to receive events",
-            "endpoint": "/notion-webhook"
-        }), 200
+        return fixed_response(_NOTION_READY_BODY)
     
     # Handle POST request (webhook events)
     try:
+        # Parse the raw body directly with orjson instead of Flask's request.json
+        raw_body = request.get_data(cache=False)
+        if len(raw_body) >= WEBHOOK_MAX_BODY_BYTES:
+            return fixed_response(_TOO_LARGE_BODY, 413)
+        
+        # Reject spoofed events before parsing anything (the unsigned subscription
+        # verification request only arrives before the secret is configured)
+        if raw_body and not verify_notion_signature(raw_body, request.headers.get("X-Notion-Signature")):
+            logger.warning("🚫 Invalid Notion webhook signature, rejecting request")
+            return fixed_response(_INVALID_SIGNATURE_BODY, 401)
+        
+        try:
+            event = orjson.loads(raw_body) if raw_body else None
+        except orjson.JSONDecodeError:
+            event = None
+        
         # Handle case where request has no JSON body (verification might be in query params or headers)
-        if not request.is_json:
+        if event is None:
             # Check for token in query parameters
             token = request.args.get('token') or request.args.get('challenge') or request.args.get('verification_token')
             if token:
-                print(f"   ✅ Verification token from query params: {token}")
+                logger.info("✅ Verification token from query params: %s", token)
                 return jsonify({"challenge": token, "token": token}), 200
             
             # Check headers for token
             token_header = request.headers.get('X-Notion-Verification-Token') or request.headers.get('Notion-Verification-Token')
             if token_header:
-                print(f"   ✅ Verification token from headers: {token_header}")
+                logger.info("✅ Verification token from headers: %s", token_header)
                 return jsonify({"challenge": token_header, "token": token_header}), 200
             
             # Return empty JSON if no JSON body
-            return jsonify({
-                "status": "ready",
-                "message": "Endpoint is ready"
-            }), 200
-        
-        # Get the webhook event
-        event = request.json
+            return fixed_response(_ENDPOINT_READY_BODY)
         
         if not event:
             return jsonify({
@@ -76,47 +290,60 @@ def notion_webhook():
                 "message": "No event data received"
             }), 400
         
-        # Log the incoming request for debugging
-        print(f"\n📨 Received webhook request:")
-        print(f"   Method: {request.method}")
-        print(f"   Headers: {dict(request.headers)}")
-        print(f"   Data: {event}")
+        # Events that can change a user page skip the verification checks below
+        if not isinstance(event, dict) or not is_sync_event(event):
+            # Check if this is a verification challenge
+            # Notion sends verification tokens in different formats:
+            # 1. As "challenge" field - echo it back
+            # 2. As "token" field - return it
+            # 3. In request body - return the whole response
+            
+            if isinstance(event, dict):
+                # Check for challenge token
+                challenge = event.get("challenge") or event.get("token") or event.get("verification_token")
+                if challenge:
+                    # Echo back the challenge for verification
+                    logger.info("✅ Verification token received: %s", challenge)
+                    return jsonify({"challenge": challenge}), 200
+                
+                # Check if it's a verification request
+                if event.get("type") == "verification":
+                    # Return the token if present
+                    token = event.get("token") or event.get("challenge")
+                    if token:
+                        logger.info("✅ Verification token: %s", token)
+                        return jsonify({"token": token, "challenge": token}), 200
+            
+            # Nothing to sync for any other event type
+            return "", 204
         
-        # Check if this is a verification challenge
-        # Notion sends verification tokens in different formats:
-        # 1. As "challenge" field - echo it back
-        # 2. As "token" field - return it
-        # 3. In request body - return the whole response
+        # Most page events are for other databases: those (and redeliveries)
+        # are answered without logging or building a response body
+        page_id, result = screen_notion_webhook(event)
+        if result is not None:
+            # Screening only fails on a malformed event (no page ID), which
+            # redelivery cannot fix, so it is a 400 rather than a 500
+            if result["status"] == "error":
+                return jsonify(result), 400
+            return "", 204
         
-        if isinstance(event, dict):
-            # Check for challenge token
-            challenge = event.get("challenge") or event.get("token") or event.get("verification_token")
-            if challenge:
-                # Echo back the challenge for verification
-                print(f"   ✅ Verification token received: {challenge}")
-                return jsonify({"challenge": challenge}), 200
-            
-            # Check if it's a verification request
-            if event.get("type") == "verification" or "verify" in str(event).lower():
-                # Return the token if present
-                token = event.get("token") or event.get("challenge")
-                if token:
-                    print(f"   ✅ Verification token: {token}")
-                    return jsonify({"token": token, "challenge": token}), 200
+        # Log the incoming request for debugging (formatted only when DEBUG is on)
+        logger.debug("📨 Received webhook request: %s", event)
         
-        # Handle the webhook event
-        result = handle_notion_webhook(event)
+        # Acknowledge right away and sync in the background: Notion retries
+        # webhooks that are not answered quickly
+        if not process_in_background("Notion", sync_notion_page, page_id):
+            release_notion_event(event)
+            return queue_full_response()
         
-        # Return appropriate status code
-        if result["status"] == "success":
-            return jsonify(result), 200
-        elif result["status"] == "ignored":
-            return jsonify(result), 200  # Still OK, just not a user page
-        else:
-            return jsonify(result), 500
+        return jsonify({
+            "status": "accepted",
+            "message": f"User {page_id} queued for sync to HubSpot",
+            "page_id": page_id
+        }), 202
             
     except Exception as e:
-        print(f"   ❌ Error: {str(e)}")
+        logger.exception("❌ Error handling webhook: %s", e)
         return jsonify({
             "status": "error",
             "message": f"Exception handling webhook: {str(e)}"
@@ -130,15 +357,15 @@ def hubspot_webhook():
     """
     # Handle GET request (verification)
     if request.method == 'GET':
-        return jsonify({
-            "status": "ready",
-            "message": "HubSpot webhook endpoint is ready to receive events",
-            "endpoint": "/hubspot-webhook"
-        }), 200
+        return fixed_response(_HUBSPOT_READY_BODY)
     
     # Handle POST request (webhook events)
     try:
-        event = request.json
+        # Parse the raw body directly with orjson (HubSpot always sends JSON)
+        raw_body = request.get_data(cache=False)
+        if len(raw_body) >= WEBHOOK_MAX_BODY_BYTES:
+            return fixed_response(_TOO_LARGE_BODY, 413)
+        event = orjson.loads(raw_body) if raw_body else None
         
         if not event:
             return jsonify({
@@ -146,24 +373,28 @@ def hubspot_webhook():
                 "message": "No event data received"
             }), 400
         
-        # Log the incoming request
-        print(f"\n📨 Received HubSpot webhook request:")
-        print(f"   Method: {request.method}")
-        print(f"   Data: {event}")
+        # Log the incoming request (formatted only when DEBUG is on)
+        logger.debug("📨 Received HubSpot webhook request: %s", event)
+        
+        # Shed load before queueing: HubSpot re-delivers webhooks answered with a 429
+        rejected = admit_hubspot_webhook(event)
+        if rejected:
+            response = jsonify(rejected)
+            response.headers["Retry-After"] = str(math.ceil(rejected["retry_after"]))
+            return response, 429
         
-        # Handle the webhook event
-        result = handle_hubspot_user_webhook(event)
+        # Acknowledge right away and normalize names in the background:
+        # HubSpot re-delivers events that are not acknowledged quickly
+        if not process_in_background("HubSpot", handle_hubspot_user_webhook, event):
+            return queue_full_response()
         
-        # Return appropriate status code
-        if result["status"] == "success":
-            return jsonify(result), 200
-        elif result["status"] == "ignored":
-            return jsonify(result), 200
-        else:
-            return jsonify(result), 500
+        return jsonify({
+            "status": "accepted",
+            "message": "HubSpot webhook event queued for processing"
+        }), 202
             
     except Exception as e:
-        print(f"   ❌ Error: {str(e)}")
+        logger.exception("❌ Error handling webhook: %s", e)
         return jsonify({
             "status": "error",
             "message": f"Exception handling HubSpot webhook: {str(e)}"
@@ -172,19 +403,7 @@ def hubspot_webhook():
 @app.route('/', methods=['GET'])
 def home():
     """Home page with instructions"""
-    return jsonify({
-        "service": "Notion to HubSpot User Sync Webhook",
-        "endpoints": {
-            "/notion-webhook": "POST - Webhook endpoint for Notion events (syncs users to HubSpot)",
-            "/hubspot-webhook": "POST - Webhook endpoint for HubSpot events (normalizes names)",
-            "/health": "GET - Health check"
-        },
-        "instructions": {
-            "1": "Notion webhook: Configure in Notion → https://your-server.com/notion-webhook",
-            "2": "HubSpot webhook: Configure in HubSpot → https://your-server.com/hubspot-webhook",
-            "3": "HubSpot webhook normalizes user names (capitalizes first letters)"
-        }
-    }), 200
+    return fixed_response(_HOME_BODY)
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -203,5 +422,5 @@ if __name__ == '__main__':
     print("     (Note: HubSpot user webhooks may need custom setup)")
     print("\n" + "=" * 60 + "\n")
     
-    app.run(host=HOST, port=PORT, debug=True)
+    app.run(host=HOST, port=PORT, debug=DEBUG, use_reloader=DEBUG, threaded=True)
 